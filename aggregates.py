@@ -0,0 +1,274 @@
+# Data handling
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from collections import namedtuple
+
+# Counts summed over the aggregate cube
+COUNTS = ["batches", "passes", "colour_passes"]
+
+# Most bins a specification histogram is split into
+HISTOGRAM_MAX_BINS = 50
+
+# Time buckets the trend charts can be grouped by. Key: granularity => Value: name used in the selector and chart titles
+GRANULARITIES = {"day": "Daily", "week": "Weekly", "month": "Monthly", "shift": "Shift"}
+# Shift pattern: shifts of SHIFT_HOURS hours, the first of the day starting at SHIFT_START_HOUR
+SHIFT_START_HOUR = 6
+SHIFT_HOURS = 8
+
+# cube: batches, passes and colour conformance per day and Material Colour. colours: Material Colours in order of first appearance
+ProductAggregates = namedtuple("ProductAggregates", ["cube", "colours"])
+
+# days: manufacture day of each batch in date order. positions: row of each batch in the product frame
+# counts: cumulative counts, row i holding the totals of the first i batches. columns: count names, COUNTS then failure codes
+# codes: failure codes in order of first appearance in the product
+PrefixIndex = namedtuple("PrefixIndex", ["days", "positions", "counts", "columns", "codes"])
+
+# days: days with batches, sorted. colours: Material Colours in order of first appearance. edges: Key: spec => Value: bin edges
+# counts: Key: spec => Value: DayCounts of the spec
+SpecHistograms = namedtuple("SpecHistograms", ["days", "colours", "edges", "counts"])
+
+# vocabulary: failure codes in order of first appearance. matrix: boolean matrix with a row per batch and a column per code
+FailureCodes = namedtuple("FailureCodes", ["vocabulary", "matrix"])
+
+# Bin counts of a specification kept only where there are batches, in day order
+# offsets: first entry of each day, with the number of entries appended. colours, bins, counts: one value per entry
+DayCounts = namedtuple("DayCounts", ["offsets", "colours", "bins", "counts"])
+
+"""
+Start of the shift each batch was made in
+Batches logged with a date but no time of manufacture count towards the first shift of their day
+
+"""
+def shift_starts(index):
+    stamps = pd.DatetimeIndex(index)
+    offset = pd.Timedelta(hours=SHIFT_START_HOUR)
+    stamps = stamps.where(stamps != stamps.normalize(), stamps + offset)
+    return (stamps - offset).floor(f"{SHIFT_HOURS}h") + offset
+
+"""
+Builds the aggregate cube of a product frame, once per data version
+Each row holds a day, shift and Material Colour with its batch count, pass count and colour conformance count (batches without
+a Colour failure) and the position of its first batch, so colours can be listed in the order they appear
+Weeks, months and date ranges are sums over the cube, so charts and tiles never slice the product frame
+
+"""
+def build_aggregates(df):
+    batches = pd.DataFrame({
+        "day": pd.DatetimeIndex(df.index).normalize(),
+        "shift": shift_starts(df.index),
+        "colour": df["Material Colour"].to_numpy(),
+        "batches": 1,
+        "passes": (df["Result"] == "Pass").to_numpy(dtype="int64"),
+        "first": np.arange(len(df)),
+    })
+    if "Colour" in df.columns:
+        batches["colour_passes"] = df["Colour"].isna().to_numpy(dtype="int64")
+
+    cube = batches.groupby(["day", "shift", "colour"], sort=True).agg(
+        {**{column: "sum" for column in COUNTS if column in batches.columns}, "first": "min"}).reset_index()
+    colours = list(cube.groupby("colour")["first"].min().sort_values().index)
+
+    return ProductAggregates(cube, colours)
+
+# Pass rate (%) of a set of batches. NaN without batches, 0 when none passed
+def pass_rate(passes, batches):
+    if batches == 0:
+        return np.nan
+    if passes == 0:
+        return 0
+    return passes / batches * 100
+
+"""
+Start of the time bucket each day falls in, for the day, week (Monday based) and month granularities
+
+"""
+def period_start(days, granularity):
+    if granularity == "week":
+        return days - pd.to_timedelta(days.dt.weekday, unit="D")
+    if granularity == "month":
+        return days.dt.to_period("M").dt.start_time
+    return days
+
+"""
+Sums the cube into day, week, month or shift buckets from start_date to end_date in one groupby pass
+Returns counts indexed by (bucket start, Material Colour), latest bucket first
+Week and month buckets cover their whole period up to end_date, and the earliest one is the first whose last day is
+after start_date, as the weekly charts have always done
+
+"""
+def time_buckets(cube, granularity, start_date, end_date):
+    columns = [column for column in COUNTS if column in cube.columns]
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+
+    first_day = start_date
+    if granularity in ("week", "month"):
+        first_day = period_start(pd.Series([start_date + timedelta(days=1)]), granularity)[0]
+        if end_date <= start_date:
+            first_day = end_date + timedelta(days=1)
+
+    days = cube["day"]
+    rows = cube[(days >= first_day) & (days <= end_date)]
+    if granularity == "shift":
+        buckets = rows["shift"]
+    else:
+        buckets = period_start(rows["day"], granularity)
+
+    counts = rows.groupby([buckets.rename("bucket"), rows["colour"]])[columns].sum()
+    return counts.sort_index(level="bucket", ascending=False, sort_remaining=False)
+
+"""
+Interns the failure codes of the batches
+Each distinct Failure code value is split into its comma separated codes once, in upper case without surrounding spaces,
+and batches are mapped to the codes of their value. Batches without a failure code have no codes
+
+"""
+def intern_failure_codes(codes):
+    inverse, values = pd.factorize(codes)
+
+    vocabulary = {}
+    value_codes = []
+    for value in values:
+        value_codes.append([vocabulary.setdefault(code, len(vocabulary))
+                            for code in (part.strip().upper() for part in str(value).split(",")) if code])
+
+    # One row per distinct value, and a last row of no codes for missing values (factorized as -1)
+    table = np.zeros((len(values) + 1, len(vocabulary)), dtype=bool)
+    for position, positions in enumerate(value_codes):
+        table[position, positions] = True
+    return FailureCodes(list(vocabulary), table[inverse])
+
+"""
+Builds the cumulative count index of a product frame, once per data version
+Key: Material Colour, and "All" for every batch => Value: PrefixIndex over its batches sorted by manufacture day
+Counts cover batches, passes, colour conformance and every interned failure code (multiple codes on a batch count once each),
+so the totals of any date range are two binary searches and a subtraction
+
+"""
+def build_range_index(df):
+    counts = pd.DataFrame({
+        "batches": 1,
+        "passes": (df["Result"] == "Pass").to_numpy(dtype="int64"),
+    }, index=np.arange(len(df)))
+    if "Colour" in df.columns:
+        counts["colour_passes"] = df["Colour"].isna().to_numpy(dtype="int64")
+    failure_codes = intern_failure_codes(df["Failure code"])
+    codes = pd.DataFrame(failure_codes.matrix.astype("int64"), columns=failure_codes.vocabulary, index=counts.index)
+    counts = pd.concat([counts, codes], axis=1)
+
+    days = pd.DatetimeIndex(df.index).normalize().to_numpy()
+    colours = df["Material Colour"].to_numpy()
+    values = counts.to_numpy(dtype="int64")
+
+    index = {}
+    for colour in ["All"] + list(pd.unique(colours)):
+        positions = np.arange(len(df)) if colour == "All" else np.flatnonzero(colours == colour)
+        positions = positions[np.argsort(days[positions], kind="stable")]
+        cumulative = np.zeros((len(positions) + 1, values.shape[1]), dtype="int64")
+        np.cumsum(values[positions], axis=0, out=cumulative[1:])
+        index[colour] = PrefixIndex(days[positions], positions, cumulative, list(counts.columns), failure_codes.vocabulary)
+    return index
+
+# Bounds of the batches of a PrefixIndex made from start to end date (inclusive)
+def range_bounds(prefix, start_date, end_date):
+    start = np.searchsorted(prefix.days, np.datetime64(pd.Timestamp(start_date), "ns"), side="left")
+    end = np.searchsorted(prefix.days, np.datetime64(pd.Timestamp(end_date), "ns"), side="right")
+    return start, max(start, end)
+
+# Frame rows of the batches of a Material Colour (or "All") made from start to end date (inclusive), in frame order
+def view_positions(range_index, colour, start_date, end_date):
+    if colour not in range_index:
+        return np.array([], dtype="int64")
+    prefix = range_index[colour]
+    start, end = range_bounds(prefix, start_date, end_date)
+    return np.sort(prefix.positions[start:end])
+
+# Totals of a PrefixIndex from start to end date (inclusive). Key: count name => Value: numpy count
+def range_totals(prefix, start_date, end_date):
+    start, end = range_bounds(prefix, start_date, end_date)
+    return dict(zip(prefix.columns, prefix.counts[end] - prefix.counts[start]))
+
+"""
+Totals of several date ranges at once for "All" and every Material Colour, with two binary searches per index
+periods: list of (start date, end date) pairs, both inclusive
+Key: Material Colour or "All" => Value: (counts, firsts). counts holds a row of totals per period in the order of the
+index columns, firsts the frame row of the first batch made in each period, or -1 when none were made
+
+"""
+def period_totals(range_index, periods):
+    starts = np.array([np.datetime64(pd.Timestamp(start), "ns") for start, end in periods])
+    ends = np.array([np.datetime64(pd.Timestamp(end), "ns") for start, end in periods])
+
+    totals = {}
+    for colour, prefix in range_index.items():
+        lower = np.searchsorted(prefix.days, starts, side="left")
+        upper = np.maximum(lower, np.searchsorted(prefix.days, ends, side="right"))
+        firsts = np.full(len(periods), -1)
+        made = upper > lower
+        firsts[made] = prefix.positions[lower[made]]
+        totals[colour] = (prefix.counts[upper] - prefix.counts[lower], firsts)
+    return totals
+
+# Bin edges of a specification. numpy's automatic bin width, with at most HISTOGRAM_MAX_BINS bins
+def histogram_edges(values):
+    edges = np.histogram_bin_edges(values, bins="auto")
+    if len(edges) - 1 > HISTOGRAM_MAX_BINS:
+        edges = np.histogram_bin_edges(values, bins=HISTOGRAM_MAX_BINS)
+    return edges
+
+"""
+Builds the specification histograms of a product frame, once per data version
+Every numeric specification gets fixed bin edges over all of its recorded values above 1 (the values the distribution
+graph shows), and the bin counts per Material Colour and day are kept for the (day, colour, bin) that have batches
+They take no more room than the batches do, however many days the product spans, and the counts of a date range are
+the sum of its days' entries. The counts of every colour add up to "All"
+
+"""
+def build_histograms(df):
+    days, day_positions = np.unique(pd.DatetimeIndex(df.index).normalize().to_numpy(), return_inverse=True)
+    colours = list(pd.unique(df["Material Colour"]))
+    # Categorical codes are int8, which the flat (colour, day, bin) positions would overflow
+    colour_positions = pd.Categorical(df["Material Colour"], categories=colours).codes.astype("int64")
+
+    edges = {}
+    counts = {}
+    for spec in df.columns:
+        if df.dtypes[spec] != "int64" and df.dtypes[spec] != "float64":
+            continue
+        values = df[spec].to_numpy(dtype="float64")
+        recorded = values > 1
+        if not recorded.any():
+            continue
+
+        spec_edges = histogram_edges(values[recorded])
+        bins = len(spec_edges) - 1
+        # Bins are closed on the left, apart from the last which also holds the largest value, as np.histogram
+        positions = np.searchsorted(spec_edges, values[recorded], side="right") - 1
+        positions = positions.clip(max=bins - 1)
+
+        # One count per (day, colour, bin) with batches, sorted by day
+        flat = (day_positions[recorded] * len(colours) + colour_positions[recorded]) * bins + positions
+        entries, entry_counts = np.unique(flat, return_counts=True)
+        entry_days = entries // (len(colours) * bins)
+        edges[spec] = spec_edges
+        counts[spec] = DayCounts(np.searchsorted(entry_days, np.arange(len(days) + 1)),
+                                 entries // bins % len(colours), entries % bins, entry_counts)
+
+    return SpecHistograms(days, colours, edges, counts)
+
+# Bin counts of a specification from start to end date (inclusive), for a Material Colour or "All"
+def histogram_counts(histograms, spec, colour, start_date, end_date):
+    if spec not in histograms.edges or (colour != "All" and colour not in histograms.colours):
+        return np.array([]), np.array([], dtype="int64")
+
+    start = np.searchsorted(histograms.days, np.datetime64(pd.Timestamp(start_date), "ns"), side="left")
+    end = max(start, np.searchsorted(histograms.days, np.datetime64(pd.Timestamp(end_date), "ns"), side="right"))
+    day_counts = histograms.counts[spec]
+    entries = slice(day_counts.offsets[start], day_counts.offsets[end])
+    bins, counts = day_counts.bins[entries], day_counts.counts[entries]
+    if colour != "All":
+        selected = day_counts.colours[entries] == histograms.colours.index(colour)
+        bins, counts = bins[selected], counts[selected]
+    counts = np.bincount(bins, weights=counts, minlength=len(histograms.edges[spec]) - 1)
+    return histograms.edges[spec], counts.astype("int64")
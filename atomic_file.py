@@ -0,0 +1,34 @@
+# File sharing
+import os
+import glob
+from threading import get_ident
+from contextlib import contextmanager
+
+"""
+Writes a file in one step. Yields a temporary path next to path for the caller to write the file to, which is moved into
+place once the caller is done so readers never see a partial file. When writing fails the temporary file is removed and
+the error is raised to the caller
+
+"""
+@contextmanager
+def atomic_file(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+# Removes the files matching pattern other than path, such as older versions of a shared file. Files still open are left
+def remove_others(pattern, path):
+    for other_path in glob.glob(pattern):
+        if other_path != path:
+            try:
+                os.remove(other_path)
+            except OSError:
+                pass
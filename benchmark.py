@@ -0,0 +1,152 @@
+# File sharing and data handling modules
+import io
+import os
+import json
+import time
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+
+# Imports from other files
+from synthetic_workbooks import SIZES, generate_products, synthetic_filename
+
+# Times a call of function, keeping what it prints out of the report. Returns the result and the seconds it took
+def timed(function, *args):
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function(*args)
+    return result, time.perf_counter() - start
+
+# Output, input and state (component id, property) lists and function of every callback registered on the app
+def registered_callbacks(app):
+    callbacks = []
+    for key, entry in app.callback_map.items():
+        outputs = key.strip(".").split("...") if key.startswith("..") else [key]
+        callbacks.append((
+            entry["callback"].__wrapped__,
+            [tuple(output.rsplit(".", 1)) for output in outputs],
+            [(item["id"], item["property"]) for item in entry["inputs"]],
+            [(item["id"], item["property"]) for item in entry.get("state", [])],
+        ))
+    return callbacks
+
+# Name of a callback in the report. Function names repeat across modules (update_spec), so the first output is added
+def callback_name(callback):
+    return f"{callback[0].__name__} ({callback[1][0][0]})"
+
+# Key: (component id, property) => Value: initial value, for every property set in the layout
+def layout_props(layout):
+    props = {}
+    for component in [layout, *layout._traverse()]:
+        component_id = getattr(component, "id", None)
+        if component_id is None:
+            continue
+        for prop in component._prop_names:
+            value = getattr(component, prop, None)
+            if value is not None:
+                props[(component_id, prop)] = value
+    return props
+
+"""
+Runs every callback once, as the browser does on page load: a callback runs once the callbacks producing its inputs
+have run, with the values they returned. props holds the property values and is updated with the callback outputs
+Returns Key: Callback name => Value: seconds the callback took, or the exception it raised
+
+"""
+def run_callbacks(callbacks, props):
+    from dash import no_update
+    from dash.exceptions import PreventUpdate
+
+    timings = {}
+    pending = list(callbacks)
+    while pending:
+        produced = {output: callback for callback in pending for output in callback[1]}
+        ready = [callback for callback in pending
+                 if all(produced.get(prop, callback) is callback for prop in callback[2])]
+        if not ready:
+            raise RuntimeError(f"Callbacks waiting on each other: {[callback[0].__name__ for callback in pending]}")
+
+        for callback in ready:
+            function, outputs, inputs, states = callback
+            pending.remove(callback)
+            name = callback_name(callback)
+            try:
+                result, seconds = timed(function, *[props.get(prop) for prop in inputs + states])
+            except PreventUpdate:
+                timings[name] = 0.0
+                continue
+            except Exception as error:
+                timings[name] = error
+                continue
+            timings[name] = seconds
+
+            results = list(result) if len(outputs) > 1 else [result]
+            for output, value in zip(outputs, results):
+                if value is not no_update:
+                    props[output] = value
+    return timings
+
+# Formats a callback timing for the report
+def format_timing(timing):
+    if isinstance(timing, Exception):
+        return f"{type(timing).__name__}: {timing}"
+    return f"{timing * 1000:10.1f} ms"
+
+"""
+Benchmarks the ingest pipeline and the dashboard callbacks on a synthetic check sheet of every size
+For each check sheet process_product_data is timed reading the workbook, then every registered callback is run as on
+page load with the product selected: first with nothing cached (decoding, aggregates and figures are built), then
+again as a refresh tick finds it (served from the caches)
+Returns Key: Check sheet size => Value: timings in seconds
+
+"""
+def run_benchmark(products_path, sizes=SIZES):
+    # The products and cache directories are read when the pipeline modules are imported
+    from data_pipeline import process_product_data
+    from product_cache import product_cache, workbook_fingerprint
+    from wishaw_dashboard import app
+
+    callbacks = registered_callbacks(app)
+    results = {}
+    for rows in sizes:
+        filename = synthetic_filename(rows)
+        product = " ".join(filename.split(" ")[:2])
+        print(f"\n{product} ({rows:,} batches)")
+
+        (df, limits), seconds = timed(process_product_data, filename, products_path)
+        timings = {"process_product_data": seconds}
+        print(f"  {'process_product_data':<48}{seconds * 1000:10.1f} ms")
+        # The callbacks start from the processed product, as they do once the prefetcher has warmed it
+        product_cache.put(filename, workbook_fingerprint(filename), df, limits)
+
+        props = layout_props(app.layout)
+        props[("product-drop-down", "value")] = product
+        first = run_callbacks(callbacks, props)
+        repeat = run_callbacks(callbacks, props)
+        for name in first:
+            print(f"  {name:<48}{format_timing(first[name])}   repeat {format_timing(repeat[name])}")
+            timings[name] = [None if isinstance(timing, Exception) else timing for timing in (first[name], repeat[name])]
+        results[rows] = timings
+    return results
+
+
+# Run benchmark
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the ingest pipeline and dashboard callbacks on synthetic check sheets")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Number of batches of each check sheet")
+    parser.add_argument("--products", default=os.path.join(tempfile.gettempdir(), "qc-benchmark-products"),
+                        help="Directory the synthetic check sheets are generated in, and reused from")
+    parser.add_argument("--output", help="File a JSON line with the timings of this run is appended to, to track them over time "
+                             "(bench_output.txt is ignored by git)")
+    args = parser.parse_args()
+
+    generate_products(args.products, args.sizes)
+    # Read the synthetic check sheets, and keep the parsed products away from the dashboard's own cache
+    os.environ["QC_PRODUCTS_PATH"] = args.products
+    os.environ["QC_CACHE_PATH"] = tempfile.mkdtemp(prefix="qc-benchmark-cache-")
+
+    results = run_benchmark(args.products, args.sizes)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as output:
+            output.write(json.dumps({"date": str(datetime.now()), "results": results}) + "\n")
@@ -0,0 +1,77 @@
+# Data handling
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock, RLock
+
+"""
+Least recently used memo of objects built once per token, even when several threads ask for a token at the same time
+Holds at most maxsize values and, when sizeof is passed, at most maxbytes of them as sizeof measures them. The most
+recently stored value is always kept. Values are never None, which get returns for a token that isn't held
+
+"""
+class BuildMemo:
+    def __init__(self, maxsize=None, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        # Key: token => Value: (value, size in bytes)
+        self._values = OrderedDict()
+        # Key: token => Value: lock held while the token is built
+        self._building = {}
+        self._lock = RLock()
+
+    # Value held for a token, marked as recently used. None when it isn't held
+    def get(self, token):
+        with self._lock:
+            entry = self._values.get(token)
+            if entry is None:
+                return None
+            self._values.move_to_end(token)
+            return entry[0]
+
+    # Stores the value of a token, evicting the least recently used values beyond the limits
+    # Returns the value held for the token, which is the one stored first when another thread stored it too
+    def put(self, token, value):
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            if token in self._values:
+                self._values.move_to_end(token)
+                return self._values[token][0]
+            self._values[token] = (value, size)
+            self.nbytes += size
+            while len(self._values) > 1 and (
+                    (self.maxsize is not None and len(self._values) > self.maxsize) or
+                    (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+                evicted, (evicted_value, evicted_size) = self._values.popitem(last=False)
+                self.nbytes -= evicted_size
+        return value
+
+    # Drops the tokens for which stale(token) holds
+    def forget(self, stale):
+        with self._lock:
+            for token in [token for token in self._values if stale(token)]:
+                self.nbytes -= self._values.pop(token)[1]
+
+    # Holds the build lock of a token, so one thread builds it while the others wait and then find it held
+    @contextmanager
+    def building(self, token):
+        with self._lock:
+            token_lock = self._building.setdefault(token, Lock())
+        try:
+            with token_lock:
+                yield
+        finally:
+            with self._lock:
+                self._building.pop(token, None)
+
+    # Value of a token, calling build() to make it when it isn't held
+    def load(self, token, build):
+        value = self.get(token)
+        if value is not None:
+            return value
+        with self.building(token):
+            value = self.get(token)
+            if value is None:
+                value = self.put(token, build())
+        return value
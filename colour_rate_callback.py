@@ -1,21 +1,17 @@
-# File sharing
-from sys import displayhook
-
 # Data handling
-import numpy as np
-import pandas as pd
-from datetime import timedelta
-from datetime import datetime
-import math
 from itertools import cycle
 
 # Data visualisation
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 # Dashboard modules
 from dash import Input, Output
 
+# Imports from other files
+from data_store import load_aggregates, view_dates
+from aggregates import time_buckets, pass_rate
+from figure_cache import cache_figure
+
 def colour_rate_callback(app, colours):
     # Callback function gets called whenever the product drop down value changes
     @app.callback(
@@ -26,67 +22,49 @@ def colour_rate_callback(app, colours):
         # Uses the value attribute from the product-drop-down component as the argument for the below function
         Input('memory', 'data'),
         Input("memory-title", "data"),
-        # Start data parameter
-        Input('date-selector', "start_date"),
-        # End date parameter
-        Input('date-selector', "end_date")
+        # Date range parameter
+        Input("memory-view", "data"),
+        # Time bucket parameter
+        Input("granularity-selector", "value")
     )
-    def update_colour_rate(json, title, start_date, end_date):
-        # Process corresponding product QC data
-        df = pd.read_json(json, orient='split')
+    # Built once per data version and inputs for every viewer
+    @cache_figure("colour-graph")
+    def update_colour_rate(json, title, view, granularity):
+        # Imported on first use so the server doesn't wait on plotly.subplots to start
+        from plotly.subplots import make_subplots
+
+        # Aggregate cube of the corresponding product QC data
+        aggregates = load_aggregates(json)
         
         fig = make_subplots(specs=[[{"secondary_y": True}]])
 
         palette = cycle(
             ['#d95f02', '#1b9e77', '#7570b3', '#e7298a', '#66a61e','#e6ab02','#a6761d', "#232323"])
 
-        # Initiate start date
-        if start_date == None:
-            start_date = df.iloc[:, 0][1].split("T")[0]
-        else:
-            start_date = start_date
+        # Dates of the selected view
+        start_date, curr_date = view_dates(view)
 
-        for colour in df["Material Colour"].unique():
-            # Initiate end date
-            if end_date == None:
-                curr_date = str(datetime.today()).split(" ")[0]
-            else:
-                curr_date = end_date
+        # Counts per time bucket and colour, latest first. Batches without a Colour failure pass on colour
+        counts = time_buckets(aggregates.cube, granularity, start_date, curr_date)
+        colour_counts = {colour: frame.droplevel("colour") for colour, frame in counts.groupby(level="colour", sort=False)}
 
+        for colour in aggregates.colours:
             pass_rates = []
             batches = []
-            weeks = []
-
-            while curr_date > start_date:
-                curr_date_dt = datetime.strptime(curr_date, "%Y-%m-%d")
-                monday_date = curr_date_dt - \
-                    timedelta(days=curr_date_dt.weekday())
-
-                df_sliced = df[str(monday_date): str(curr_date)]
-
-                try:
-                    pass_rate = df_sliced.groupby('Material Colour')['Colour'].value_counts(
-                        normalize=True, dropna=False)[colour][np.nan] * 100
-                except KeyError:
-                    if len(df_sliced.loc[df_sliced['Material Colour'] == colour]) > 0:
-                        pass_rate = 0
-                    else:
-                        pass_rate = np.nan
-
-                # Only append data that is available
-                if not math.isnan(pass_rate):
-                    pass_rates.append(pass_rate)
-                    weeks.append(monday_date)
-                    batches.append(
-                        len(df_sliced.loc[df_sliced['Material Colour'] == colour]))
+            periods = []
 
-                curr_date = str(monday_date - timedelta(days=1)).split(" ")[0]
+            if colour in colour_counts:
+                frame = colour_counts[colour]
+                for period, passes, batch_count in zip(frame.index, frame["colour_passes"].to_numpy(), frame["batches"].to_numpy()):
+                    pass_rates.append(pass_rate(passes, batch_count))
+                    periods.append(period)
+                    batches.append(batch_count)
 
             curr_colour = next(palette)
 
-            fig.add_trace(go.Bar(x=weeks, y=batches,
+            fig.add_trace(go.Bar(x=periods, y=batches,
                             name=colour + " Batches", marker_color=curr_colour), secondary_y=False)
-            fig.add_trace(go.Scatter(x=weeks, y=pass_rates, name=colour + " RFT",
+            fig.add_trace(go.Scatter(x=periods, y=pass_rates, name=colour + " RFT",
                                         line=dict(color=curr_colour, width=2,), marker=dict(size=10), mode='lines+markers', connectgaps=True), secondary_y=True)
 
         fig.data = fig.data[::-1]
@@ -119,6 +97,6 @@ def colour_rate_callback(app, colours):
             font_family="Abel"
         )
 
-        if len(df['Material Colour'].unique()) == 1:
+        if len(aggregates.colours) == 1:
             return fig, f"{title} Colour Pass Rate", {"display": "none"}
-        return fig, f"{title} Colour Pass Rate", {}
\ No newline at end of file
+        return fig, f"{title} Colour Pass Rate", {}
\ No newline at end of file
@@ -3,49 +3,216 @@ import os
 import pandas as pd
 import numpy as np
 import re
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
+from pandas.io.parsers import TextParser
+
+# Excel reader
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+
+# Path to product QC spreadsheets. Set QC_PRODUCTS_PATH to read them from another directory
+PRODUCTS_PATH = os.path.abspath(os.environ.get("QC_PRODUCTS_PATH", 'G:\Quality Control\Quality Management System\QC Docs\QC\QC Check Sheets\QC Completed Check Sheets\Products'))
+
+# Excel reader engine. Set QC_EXCEL_ENGINE to calamine or openpyxl. Calamine is used by default when it is installed
+EXCEL_ENGINE = os.environ.get("QC_EXCEL_ENGINE")
+
+# Whether pandas can read workbooks with the calamine engine (pandas 2.2+ with python-calamine installed)
+@lru_cache(maxsize=None)
+def calamine_available():
+    try:
+        import python_calamine
+    except ImportError:
+        return False
+    major, minor = (int(part) for part in pd.__version__.split(".")[:2])
+    return (major, minor) >= (2, 2)
+
+# Title rows above the column labels of a QC check sheet
+TITLE_ROWS = 5
+
+# Header labels read from a workbook. Floating point and unnamed labels are never used so they aren't read
+def projected_column(label):
+    return not isinstance(label, float) and not str(label).startswith("Unnamed")
+
+# Value of a cell as pandas' openpyxl reader converts it. Empty cells are "", error cells NaN and whole numbers int
+def cell_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in ERROR_CODES:
+        return np.nan
+    return value
 
 """
-Changes directory to product directory in the wishaw enewall network drive
-Reads product QC data for the corresponding product passed as the argument
-Extracts conforming limits
-Removes unwanted columns and rows
-Creates a Failure code column and use conforming limits to assign each batch reason of failure
-Creates a result column to assign each batch pass or fail result using conforming limits
-Returns dataframe of the corresponding product as well as its limits
+Reads a QC check sheet with openpyxl, keeping only the projected columns
+The sheet is opened read only and its rows are streamed as plain values, so no cell objects are made. Cells of the other
+columns are still parsed from the sheet's XML, but they are never converted or handed to pandas' parser. Rows are
+converted and parsed as read_excel does, so the frame is the one read_excel returns with usecols=projected_column
 
 """
-def process_product_data(filename):
-    # Declare the orignal working directory path as a variable
-    owd = os.getcwd()
-    # Path to product QC spreadsheets
-    path = 'G:\Quality Control\Quality Management System\QC Docs\QC\QC Check Sheets\QC Completed Check Sheets\Products'
-    # Change working directory
-    print(f"\nChanging Directory to {path}")
-    os.chdir(path)
-
-    print(f"\nReading {filename}")
-    df = pd.read_excel(filename, skiprows=5)
-    
-    # Extract conforming limits
+def read_openpyxl(path):
+    workbook = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        # The dimensions recorded in the file may be wrong, as pandas also assumes
+        sheet.reset_dimensions()
+
+        data = []
+        positions = None
+        last_row = -1
+        for row_number, row in enumerate(sheet.iter_rows(values_only=True)):
+            # Trailing rows without values in any column are dropped, as read_excel does
+            if row.count(None) < len(row):
+                last_row = row_number
+            if row_number < TITLE_ROWS:
+                continue
+            if positions is None:
+                positions = [position for position, value in enumerate(row)
+                             if value is not None and projected_column(cell_value(value))]
+            data.append([cell_value(row[position]) if position < len(row) else "" for position in positions])
+    finally:
+        workbook.close()
+
+    data = data[:last_row - TITLE_ROWS + 1]
+    if not data:
+        return pd.DataFrame()
+    return TextParser(data, header=0, skip_blank_lines=False).read()
+
+"""
+Reads a QC check sheet with the selected engine
+Only the date, specification, Material Colour, Colour, Failure code and Provisional result columns are kept. The
+openpyxl reader only converts and parses those columns. Other engines read every column and drop the rest
+
+"""
+def read_workbook(path, engine=None):
+    engine = engine or EXCEL_ENGINE or ("calamine" if calamine_available() else "openpyxl")
+    if engine == "openpyxl":
+        return read_openpyxl(path)
+    return pd.read_excel(path, skiprows=TITLE_ROWS, usecols=projected_column, engine=engine)
+
+# Boolean mask of rows whose comma separated failure codes already contain one of the labels (case insensitive)
+def has_failure_code(codes, labels):
+    padded = "," + codes.str.upper() + ","
+    present = np.zeros(len(codes), dtype=bool)
+    for label in labels:
+        present |= padded.str.contains(f",{label},", regex=False).fillna(False).to_numpy(dtype=bool)
+    return present
+
+# Fails the masked rows and merges the label into their Failure code unless one of the skip labels is already recorded
+def flag_failures(df, mask, label, skip_labels):
+    if not mask.any():
+        return
+    df['Result'] = df['Result'].mask(mask, "Fail")
+
+    codes = df['Failure code']
+    empty = codes.isna().to_numpy(dtype=bool)
+    append = mask & ~empty & ~has_failure_code(codes, skip_labels)
+    codes = codes.mask(mask & empty, label)
+    df['Failure code'] = codes.mask(append, codes + "," + label)
+
+# Boolean mask of rows where the comparison holds. Missing values never hold
+def compare_mask(comparison):
+    return comparison.fillna(False).to_numpy(dtype=bool)
+
+"""
+Column-wise conforming limit engine
+Limits with a lower and upper value are only checked for batches with a recorded spread
+Limits with a single lower value are only checked for batches without a recorded spread
+Out of limit batches are failed and given a LOW/HIGH failure code, keeping any codes already recorded
+A provisional result of Fail overrides the result of the batch
+
+"""
+def evaluate_conforming_limits(df, conforming_limits):
+    spread_recorded = df['Spread /mm'].notna().to_numpy(dtype=bool)
+
+    for key in conforming_limits.keys():
+        if key not in df.columns:
+            continue
+        spec = key.split(" ")[0].strip("/")
+        limits = conforming_limits[key]
+        values = df[key]
+        recorded = values.notna().to_numpy(dtype=bool)
+
+        # Between an upper and lower limit
+        if len(limits) == 2:
+            checked = recorded & spread_recorded
+            low = checked & compare_mask(values < float(limits[0]))
+            high = checked & ~low & compare_mask(values > float(limits[1]))
+            for direction, mask in (("LOW", low), ("HIGH", high)):
+                spec_label = f"{direction} {spec.upper()}"
+                label = f"{direction} FLOW" if spec == "Spread" else spec_label
+                flag_failures(df, mask, label, {spec_label, label})
+        # Lower limit only
+        elif len(limits) == 1:
+            checked = recorded & ~spread_recorded
+            low = checked & compare_mask(values < float(limits[0]))
+            flag_failures(df, low, f"LOW {spec.upper()}", {f"LOW {spec.upper()}"})
+
+    # Change the result value for each batch if the provision result is different
+    if "Provisional result" in df.columns:
+        provisional_fail = df['Provisional result'].astype(str).str.upper() == "FAIL"
+        df['Result'] = df['Result'].mask(compare_mask(provisional_fail), "Fail")
+
+# Raised when appended rows can't be merged into the cached frame and the workbook has to be processed in full
+class RebuildRequired(Exception):
+    pass
+
+# Summary of an ingested workbook used to merge the rows appended to it later
+# header: digest of the column labels and limits rows, rows: number of batch rows ingested, digest: digest of those rows
+# colour_counts: Key: Material Colour => Value: Number of batches, colour_missing: whether any batch had no colour recorded
+IngestState = namedtuple("IngestState", ["header", "rows", "digest", "colour_counts", "colour_missing"])
+
+# Hash of each raw row. Used to detect edits to rows that were already ingested
+# Missing values hash the same whatever Dtype the reader gave the column
+def row_hashes(rows):
+    return pd.util.hash_pandas_object(rows.astype(object).fillna(""), index=False).to_numpy()
+
+# Digest of a sequence of row hashes
+def hashes_digest(hashes):
+    return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+# Digest of the column labels, units and conforming limits rows of a raw workbook
+def header_digest(raw):
+    return hashlib.sha1(repr(list(raw.columns)).encode("utf-8") + row_hashes(raw.iloc[:2]).tobytes()).hexdigest()
+
+# Most common Material Colour. Ties go to the first colour alphabetically, as with Series.mode
+def most_common_colour(colour_counts):
+    most = max(colour_counts.values())
+    return min(colour for colour, count in colour_counts.items() if count == most)
+
+# Extract conforming limits from the limits row of a raw workbook
+def extract_conforming_limits(df):
     conforming_limits = df.iloc[1]
     # Remove non-conforming Limits column and nulls
     conforming_limits.drop([df.columns[0]], inplace=True)
     conforming_limits.dropna(inplace=True)
-    # Convert series to dict. Key: Column label => Limits
-    conforming_limits.to_dict()
     for key in conforming_limits.keys():
         # Regex matches the numbers only in the cell. Ex: 90-120 => [90,120]
         conforming_limits[key] = re.findall(r'\d+', conforming_limits[key])
+    # Convert series to dict. Key: Column label => Limits
+    return conforming_limits.to_dict()
 
-    # Remove unwanted columns and rows
-    df = df.drop([0, 1]).reset_index(drop=True)
+# Remove unwanted columns and rows from the raw batch rows
+def select_rows(df):
+    df = df.reset_index(drop=True)
     # Remove columns that have a floating datatype label
     df = df[[col for col in df.columns if not isinstance(col, float)]]
     # Remove unnamed columns
     df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
     # Drop rows where they don't have a date of manufacture/testing recorded
     df.dropna(subset=[df.columns[0]], inplace=True)
-    
+    return df
+
+"""
+Cleans batch rows and assigns their Dtypes
+Missing Material Colours are filled with the most common colour over colour_counts and these rows. When categories are
+passed the Material Colour column uses them, so rows can be appended to a frame that was cleaned earlier
+Returns the cleaned rows, the updated colour counts and whether any of the rows had no colour recorded
+
+"""
+def clean_rows(df, colour_counts=None, categories=None):
     # Create a new Failure code column if there isn't one already
     if 'Failure code' not in df.columns:
         df['Failure code'] = pd.Series()
@@ -58,83 +225,131 @@ def process_product_data(filename):
 
     # Handle missing values.
     df.replace([r'[^\w\s]'], np.nan, regex=True, inplace=True)
-    # Spread values equal to 1 results in Fail
-    results = []
-    for index, spread in enumerate(df['Spread /mm']):
-            if spread == 1:
-                results.append("Fail")
-            else:
-                results.append("Pass")
-    # Append results to Result column
-    df['Result'] = results
+    # Spread values equal to 1 results in Fail. Append results to Result column
+    df['Result'] = np.where(df['Spread /mm'] == 1, "Fail", "Pass")
 
     # Assign correct Dtypes to columns. Convert the "Data of manufacture" column to a datetime Dtype
     df.iloc[:, 0] = pd.to_datetime(df.iloc[:, 0], errors="raise")
     # Set "Data of Manufacture" as the index
     df.set_index(df.iloc[:, 0], inplace=True)
     # Assign Material Colour and Result column to category Dtypes
-    df['Material Colour'] = df['Material Colour'].str.strip().astype('category')
+    try:
+        colours = df['Material Colour'].str.strip()
+    except AttributeError:
+        # No colours recorded in these rows. Non string values are missing, as with .str.strip
+        colours = pd.Series(np.nan, index=df.index, dtype=object)
+    colour_counts = dict(colour_counts or {})
+    for colour, count in colours.value_counts().items():
+        colour_counts[colour] = colour_counts.get(colour, 0) + int(count)
+    if categories is None:
+        df['Material Colour'] = colours.astype('category')
+    elif set(colours.dropna()) <= set(categories):
+        df['Material Colour'] = colours.astype(pd.CategoricalDtype(categories))
+    else:
+        raise RebuildRequired("new Material Colour")
+    colour_missing = bool(colours.isna().any())
     df["Material Colour"].fillna(
-        df["Material Colour"].mode()[0], inplace=True)
+        most_common_colour(colour_counts), inplace=True)
     # Convert Object Dtype columns to float or str.
     df = df.convert_dtypes()
 
     df['Failure code'] = df['Failure code'].astype("string")
 
+    return df, colour_counts, colour_missing
+
+"""
+Matches the Dtypes of appended rows to the cached frame so the merged frame is the same as a full rebuild
+Columns that are entirely missing on one side take the other side's Dtype. Integer and float columns merge as float
+Any other difference requires a full rebuild
+
+"""
+def align_dtypes(df, rows):
+    aligned = df
+    for column in df.columns:
+        old, new = df[column].dtype, rows[column].dtype
+        if old == new:
+            continue
+        if rows[column].isna().all() and isinstance(old, pd.api.extensions.ExtensionDtype):
+            rows[column] = rows[column].astype(old)
+        elif df[column].isna().all() and isinstance(new, pd.api.extensions.ExtensionDtype):
+            if aligned is df:
+                aligned = df.copy()
+            aligned[column] = df[column].astype(new)
+        elif {str(old), str(new)} == {"Int64", "Float64"}:
+            if aligned is df:
+                aligned = df.copy()
+            aligned[column] = df[column].astype("Float64")
+            rows[column] = rows[column].astype("Float64")
+        else:
+            raise RebuildRequired(f"{column} changed type")
+    return aligned, rows
+
+"""
+Processes only the rows appended to a workbook since it was last ingested and merges them into the cached frame
+Raises RebuildRequired when the header or conforming limits changed, earlier rows were edited or the appended rows
+can't be merged exactly
+
+"""
+def append_product_rows(raw, header, hashes, df, conforming_limits, state):
+    if state is None or header != state.header:
+        raise RebuildRequired("header or conforming limits changed")
+    if len(hashes) < state.rows or hashes_digest(hashes[:state.rows]) != state.digest:
+        raise RebuildRequired("earlier rows were edited")
+
+    rows = select_rows(raw.iloc[2 + state.rows:])
+    if len(rows) == 0:
+        return df, conforming_limits, state._replace(rows=len(hashes), digest=hashes_digest(hashes))
+
+    rows, colour_counts, colour_missing = clean_rows(rows, state.colour_counts, df['Material Colour'].cat.categories)
+    # Earlier batches without a colour were filled with the previous most common colour
+    if state.colour_missing and most_common_colour(colour_counts) != most_common_colour(state.colour_counts):
+        raise RebuildRequired("most common Material Colour changed")
+    evaluate_conforming_limits(rows, conforming_limits)
+
+    df, rows = align_dtypes(df, rows)
+    state = IngestState(header, len(hashes), hashes_digest(hashes), colour_counts, state.colour_missing or colour_missing)
+    return pd.concat([df, rows]), conforming_limits, state
+
+"""
+Reads product QC data for the corresponding product passed as the argument from the products directory
+Only full paths are used and the working directory is never changed, so products can be processed on many threads at once
+Extracts conforming limits
+Removes unwanted columns and rows
+Creates a Failure code column and use conforming limits to assign each batch reason of failure
+Creates a result column to assign each batch pass or fail result using conforming limits
+When the previous (df, limits, state) of the workbook is passed, only rows appended since then are processed
+Returns dataframe of the corresponding product, its limits and the ingest state
+
+"""
+def ingest_product_data(filename, products_path=None, engine=None, previous=None):
+    # Full path to the product QC spreadsheet
+    path = os.path.join(products_path or PRODUCTS_PATH, filename)
+
+    print(f"\nReading {path}")
+    raw = read_workbook(path, engine)
+    header = header_digest(raw)
+    hashes = row_hashes(raw.iloc[2:])
+
+    if previous is not None:
+        try:
+            return append_product_rows(raw, header, hashes, *previous)
+        except RebuildRequired as reason:
+            print(f"\nRebuilding {path}: {reason}")
+
+    # Extract conforming limits
+    conforming_limits = extract_conforming_limits(raw)
+
+    df, colour_counts, colour_missing = clean_rows(select_rows(raw.iloc[2:]))
+
     # Use conforming limits to determine sample failure
-    for key in conforming_limits.keys():
-        spec = key.split(" ")[0].strip("/")
-        # Between an upper and lower limit
-        if key in df.columns and len(conforming_limits[key]) == 2:
-            for index, value in enumerate(df[key]):
-                if not pd.isnull(value) and not pd.isnull(df['Spread /mm'][index]):
-                    if (value < float(conforming_limits[key][0])):
-                        df['Result'][index] = "Fail"
-                        if pd.isnull(df["Failure code"][index]):
-                            if spec == "Spread":
-                                df["Failure code"][index] = "LOW FLOW"
-                            else:
-                                df['Failure code'][index] = f"LOW {spec.upper()}"
-                        elif f"LOW {spec.upper()}" not in [code.upper() for code in df['Failure code'][index].split(",")]:
-                            if spec == "Spread":
-                                    if "LOW FLOW" not in [code.upper() for code in df['Failure code'][index].split(",")]:
-                                        df["Failure code"][index] = df["Failure code"][index] + ",LOW FLOW"
-                            else:
-                                df["Failure code"][index] = df["Failure code"][index] + f",LOW {spec.upper()}"
-                    elif (value > float(conforming_limits[key][1])):
-                        df['Result'][index] = "Fail"
-                        if pd.isnull(df["Failure code"][index]):
-                            if spec == "Spread":
-                                df["Failure code"][index] = "HIGH FLOW"
-                            else:
-                                df['Failure code'][index] = f"HIGH {spec.upper()}"
-                        elif f"HIGH {spec.upper()}" not in [code.upper() for code in df['Failure code'][index].split(",")]:
-                            if spec == "Spread":
-                                if "HIGH FLOW" not in [code.upper() for code in df['Failure code'][index].split(",")]:
-                                    df["Failure code"][index] = df["Failure code"][index] + ",HIGH FLOW"
-                            else:
-                                df["Failure code"][index] = df["Failure code"][index] + f",HIGH {spec.upper()}"
-                # If cells are empty, the value becomes Nan and can't be compared with float using >. Make the error an exception
-        elif key in df.columns and len(conforming_limits[key]) == 1:
-            for index, value in enumerate(df[key]):
-                if not pd.isnull(value) and pd.isnull(df['Spread /mm'][index]):
-                    if value < float(conforming_limits[key][0]):
-                        df['Result'][index] = "Fail"
-                        if pd.isnull(df["Failure code"][index]):
-                            df['Failure code'][index] = f"LOW {spec.upper()}"
-                        elif f"LOW {spec.upper()}" not in [code.upper() for code in df['Failure code'][index].split(",")]:
-                            df["Failure code"][index] = df["Failure code"][index] + f",LOW {spec.upper()}" 
-                            
-    # Change the result value for each batch if the provision result is different
-    if "Provisional result" in df.columns:
-        for index, p_result in enumerate(df['Provisional result']):
-            if str(p_result).upper() == "FAIL":
-                df['Result'][index] = "Fail"
-                
-    # Change back to original working directory. Allows dash server to run as this file is not found in the wishaw network drive.
-    os.chdir(owd)
-    
+    evaluate_conforming_limits(df, conforming_limits)
+
     #df.to_csv("S:\Operations\QC\QE Projects/exp.csv")
-    
-    # Return df
-    return df, conforming_limits.to_dict()
\ No newline at end of file
+
+    state = IngestState(header, len(hashes), hashes_digest(hashes), colour_counts, colour_missing)
+    return df, conforming_limits, state
+
+# Returns dataframe of the corresponding product as well as its limits, processing the whole workbook
+def process_product_data(filename, products_path=None, engine=None):
+    df, conforming_limits, state = ingest_product_data(filename, products_path, engine)
+    return df, conforming_limits
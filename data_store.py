@@ -0,0 +1,281 @@
+# Data handling
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Imports from other files
+from product_cache import product_cache, load_workbook, workbook_fingerprint
+from aggregates import build_aggregates, build_range_index, build_histograms, view_positions
+from sidecar_cache import pa
+from shared_cache import read_shared, write_shared, file_lock
+from shared_frames import publish_frame, attach_frame, frame_path
+from build_memo import BuildMemo
+
+# Number of product versions whose conforming limits and schema record are kept
+STORE_SIZE = 32
+# Memory allowed for frames decoded for callbacks, in bytes
+DECODED_MAX_BYTES = 512 * 1024 * 1024
+# Number of objects derived from decoded frames (aggregates, indexes) kept
+DERIVED_SIZE = 64
+# Number of date range and colour views whose batch positions are kept
+VIEW_SIZE = 32
+
+# Memory used by a decoded frame, in bytes
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+# Key: (Filename, version) => Value: (conforming limits, schema record) of the product
+_summaries = BuildMemo(STORE_SIZE)
+# Key: (Filename, version) => Value: decoded dataframe
+_decoded = BuildMemo(maxbytes=DECODED_MAX_BYTES, sizeof=frame_bytes)
+# Key: (Filename, version, name) => Value: object derived from the decoded frame
+_derived = BuildMemo(DERIVED_SIZE)
+# Key: (Filename, version, start date, end date, Material Colour) => Value: positions of the batches of the view
+_views = BuildMemo(VIEW_SIZE)
+
+# Version token of a workbook fingerprint
+def version_token(fingerprint):
+    return "-".join(str(part) for part in fingerprint)
+
+# Drops everything held for data versions of a workbook other than version, once that version has been published
+def forget_versions(filename, version):
+    for memo in (_summaries, _decoded, _derived, _views):
+        memo.forget(lambda token: token[0] == filename and token[1] != version)
+
+# Whether a column reaches callbacks as numbers. Text columns holding only numbers are read back as numbers from JSON too
+def numeric_column(column):
+    if pd.api.types.is_bool_dtype(column.dtype) or pd.api.types.is_datetime64_any_dtype(column.dtype):
+        return False
+    if pd.api.types.is_numeric_dtype(column.dtype):
+        return True
+    values = column.dropna()
+    return len(values) > 0 and pd.to_numeric(values.astype(str), errors="coerce").notna().all()
+
+"""
+Summary of a processed product frame for the drop down, visibility and placeholder callbacks
+specs: numeric specification columns. colours: Material Colours in order of first appearance. start/end: date span
+default_start: date the charts start from when no start date is selected. rows: number of batches
+
+"""
+def product_schema(df):
+    dates = pd.DatetimeIndex(df.index)
+    return {
+        "specs": [column for column in df.columns if numeric_column(df[column])],
+        "colours": [str(colour) for colour in pd.unique(df["Material Colour"].astype(object))],
+        "start": str(dates.min().date()) if len(df) else None,
+        "end": str(dates.max().date()) if len(df) else None,
+        "default_start": str(pd.Timestamp(df.iloc[1, 0]).date()) if len(df) > 1 else None,
+        "rows": len(df),
+    }
+
+"""
+Publishes the processed data of a product to the server side store
+Returns the small key kept in the memory dcc.Store, which callbacks use to resolve the frame, the product's conforming
+limits and the schema record of the frame
+Only the workbook is stat'ed. The limits and schema record of a version are read from the summary shared by the first
+worker to publish it, so a worker never holds the processed frame just to serve the key
+
+"""
+def publish_product(product, filename):
+    fingerprint = workbook_fingerprint(filename)
+    version = version_token(fingerprint)
+    token = (filename, version)
+
+    summary = _summaries.get(token)
+    if summary is None:
+        summary = read_shared(filename, version, "summary")
+        if summary is None:
+            df, summary = share_product(filename, fingerprint)
+            _decoded.put(token, df)
+        forget_versions(filename, version)
+        summary = _summaries.put(token, summary)
+
+    limits, schema = summary
+    return {"product": product, "file": filename, "version": version}, limits, schema
+
+"""
+Processed frame and conforming limits of a version of a workbook, taken from the product cache when it holds the version
+Without pyarrow there is no Arrow file to share the frame through, so the product cache keeps it for the next version
+
+"""
+def processed_frame(filename, fingerprint):
+    cached = product_cache.cached(filename, fingerprint)
+    if cached is not None:
+        return cached
+    if pa is None:
+        fingerprint, df, limits = product_cache.lookup(filename)
+        return df, limits
+    df, limits, state = load_workbook(filename, fingerprint, product_cache.previous(filename))
+    return df, limits
+
+"""
+Shares a version of a workbook with every worker process: the decoded frame as a memory mapped Arrow file, and the
+conforming limits and schema record as a summary. The first worker to get here reads the workbook (or its parquet
+sidecar) and the others wait for it, then attach to what it shared
+Returns the decoded frame, mapped from the Arrow file when it could be shared, and the (limits, schema record) summary
+
+"""
+def share_product(filename, fingerprint):
+    version = version_token(fingerprint)
+    df = attach_frame(filename, version)
+    summary = read_shared(filename, version, "summary")
+    if df is not None and summary is not None:
+        return df, summary
+
+    with file_lock(f"{frame_path(filename, version)}.lock"):
+        # Another worker may have shared the version while this one waited
+        df = attach_frame(filename, version)
+        summary = read_shared(filename, version, "summary")
+        if df is None or summary is None:
+            frame, limits = processed_frame(filename, fingerprint)
+            summary = (limits, product_schema(frame))
+            write_shared(filename, version, "summary", summary)
+            df = decode_frame(frame)
+            if publish_frame(filename, version, df):
+                attached = attach_frame(filename, version)
+                if attached is not None:
+                    df = attached
+    return df, summary
+
+"""
+Converts a column to the Dtype callbacks receive it as
+Integer columns without missing values stay int64 and columns of only True/False stay bool. Anything else becomes
+float64 when all of its values are numbers (or text holding numbers), and int64 when those are all whole numbers
+Dates are datetime64 to the millisecond, and other columns are categorical with their values in order of first
+appearance, so the Arrow file holds them as timestamps and dictionaries rather than Python objects
+
+"""
+def frame_column(column):
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        return pd.DatetimeIndex(column).floor("ms").to_numpy()
+    if pd.api.types.is_integer_dtype(column.dtype) and not column.hasnans:
+        return column.to_numpy(dtype="int64")
+    values = column.astype(object).to_numpy(dtype=object, na_value=None)
+    if pd.api.types.is_bool_dtype(column.dtype) and not column.hasnans:
+        return values.astype(bool)
+
+    try:
+        values = values.astype("float64")
+    except (TypeError, ValueError):
+        return pd.Categorical(values, categories=pd.unique(values[pd.notna(values)]))
+    whole = values.astype("int64") if len(values) and not np.isnan(values).any() else None
+    if whole is not None and (whole == values).all():
+        return whole
+    return values
+
+"""
+Converts a processed product frame to the frame callbacks read, with every column converted by frame_column
+The index is the Date of Manufacture to the millisecond, without a name
+
+"""
+def decode_frame(df):
+    columns = {column: frame_column(df[column]) for column in df.columns}
+    index = pd.DatetimeIndex(df.index).floor("ms")
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(index.to_numpy()), columns=df.columns)
+
+"""
+Resolves the product frame for a key from the memory dcc.Store
+Each version is decoded once, even when several callbacks ask for it at the same time, and shared by every callback
+Across worker processes it is shared through a memory mapped Arrow file, whose columns callbacks read in place
+Callbacks get a shallow copy so assigning columns never reaches the shared frame, but values must not be modified in place
+
+"""
+def load_frame(key):
+    version, df = load_frame_version(key)
+    return df
+
+"""
+Resolves the data version and product frame for a key, as load_frame does
+When the version of the key is neither held by this process nor shared by another worker, the workbook has changed since
+the key was published (or its frame couldn't be shared) and the workbook's current version is shared and returned instead
+That frame is kept under its own version, so a version never holds another version's data
+
+"""
+def load_frame_version(key):
+    token = (key["file"], key["version"])
+    version = key["version"]
+    df = _decoded.get(token)
+    if df is None:
+        with _decoded.building(token):
+            df = _decoded.get(token)
+            if df is None:
+                df = attach_frame(key["file"], version)
+                if df is None:
+                    fingerprint = workbook_fingerprint(key["file"])
+                    version = version_token(fingerprint)
+                    df = _decoded.get((key["file"], version))
+                    if df is None:
+                        df = share_product(key["file"], fingerprint)[0]
+                df = _decoded.put((key["file"], version), df)
+    return version, df.copy(deep=False)
+
+"""
+Returns an object derived from the product frame of a key, such as its aggregate cube
+build(df) runs once per data version and name, and the result is shared by every callback until the version changes
+With shared=True the result is also written to the cache directory, so other worker processes read it instead of
+building it again
+
+"""
+def load_derived(key, name, build, shared=False):
+    token = (key["file"], key["version"], name)
+    value = _derived.get(token)
+    if value is not None:
+        return value
+
+    with _derived.building(token):
+        value = _derived.get(token)
+        if value is not None:
+            return value
+        stored = token
+        value = read_shared(key["file"], key["version"], name) if shared else None
+        if value is None:
+            # Kept under the version the frame was loaded from, which is newer than the key's when the workbook changed
+            version, df = load_frame_version(key)
+            stored = (key["file"], version, name)
+            value = _derived.get(stored)
+            if value is None:
+                value = build(df)
+                if shared:
+                    write_shared(key["file"], version, name, value)
+        return _derived.put(stored, value)
+
+# Aggregate cube of the product frame of a key
+def load_aggregates(key):
+    return load_derived(key, "aggregates", build_aggregates, shared=True)
+
+# Cumulative count index of the product frame of a key, for date range totals
+def load_range_index(key):
+    return load_derived(key, "range_index", build_range_index, shared=True)
+
+# Specification histograms of the product frame of a key
+def load_histograms(key):
+    return load_derived(key, "day_histograms", build_histograms, shared=True)
+
+"""
+Resolves the dates selected in date-selector into the view every chart reads, so defaults are only worked out once
+Charts start from the product's default start date when no start date is selected. An open end (None) runs up to today
+
+"""
+def resolve_view(schema, start_date, end_date):
+    if start_date == None:
+        start_date = schema["default_start"]
+    return {"start": start_date, "end": end_date}
+
+# Start and end date of a view
+def view_dates(view):
+    if view["end"] == None:
+        return view["start"], str(datetime.today()).split(" ")[0]
+    return view["start"], view["end"]
+
+"""
+Product frame of a key restricted to the batches of a view and Material Colour ("All" for every colour)
+The rows are found once per data version, dates and colour through the cumulative count index, and shared by every chart
+Views are kept apart from the derived objects, so moving through dates never evicts the aggregates and indexes
+
+"""
+def load_view(key, view, colour="All"):
+    start_date, end_date = view_dates(view)
+    version, df = load_frame_version(key)
+    token = (key["file"], version, start_date, end_date, colour)
+    positions = _views.load(token, lambda: view_positions(load_range_index(key), colour, start_date, end_date))
+    return df.iloc[positions]
@@ -0,0 +1,58 @@
+# Data handling
+import numpy as np
+
+"""
+Largest-Triangle-Three-Buckets downsampling
+Returns the positions of threshold points that keep the visual shape of the line through x and y: the first and last
+points, and from each of the buckets in between the point forming the largest triangle with the point kept before it
+and the average of the next bucket
+
+"""
+def lttb(x, y, threshold):
+    points = len(x)
+    if threshold >= points or threshold < 3:
+        return np.arange(points)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # threshold - 2 buckets over the points between the first and the last
+    bounds = np.linspace(1, points - 1, threshold - 1).astype("int64")
+
+    selected = np.empty(threshold, dtype="int64")
+    selected[0] = 0
+    selected[-1] = points - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        # Average of the next bucket, which for the last bucket is the last point
+        if bucket + 2 < len(bounds):
+            next_x = x[end:bounds[bucket + 2]].mean()
+            next_y = y[end:bounds[bucket + 2]].mean()
+        else:
+            next_x = x[-1]
+            next_y = y[-1]
+
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+# Positions of the points outside of conforming limits ([lower] or [lower, upper]). Limits may be numeric strings
+def out_of_limits(y, limits):
+    y = np.asarray(y, dtype="float64")
+    outside = y < float(limits[0])
+    if len(limits) > 1:
+        outside |= y > float(limits[1])
+    return np.flatnonzero(outside)
+
+"""
+Positions of the points kept when a trend of more than threshold points is drawn
+The LTTB points, and every point outside of the conforming limits so no failure is hidden by the downsampling
+
+"""
+def downsample_trend(x, y, threshold, limits=None):
+    kept = lttb(x, y, threshold)
+    if limits:
+        kept = np.union1d(kept, out_of_limits(y, limits))
+    return kept
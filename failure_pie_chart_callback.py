@@ -1,14 +1,14 @@
-# Data handling
-import pandas as pd
-from datetime import datetime
-
 # Data visualisation
-import plotly.express as px
 import plotly.graph_objects as go
 
 # Dashboard modules
 from dash import Input, Output
 
+# Imports from other files
+from data_store import load_aggregates, load_range_index, view_dates
+from aggregates import range_totals
+from figure_cache import cache_figure
+
 
 def failure_pie_chart_callback(app, colours):
     # Callback function gets triggered whenever the date is changed
@@ -19,52 +19,37 @@ def failure_pie_chart_callback(app, colours):
         Input("memory", "data"),
         Input("memory-title", "data"),
         Input("colour-drop-down-3", "value"),
-        # Start data parameter
-        Input('date-selector', "start_date"),
-        # End date parameter
-        Input('date-selector', "end_date")
+        # Date range parameter
+        Input("memory-view", "data")
     )
-    def update_pie_chart(json, product, colour, start_date, end_date):
-        df = pd.read_json(json, orient='split')
+    # Built once per data version and inputs for every viewer
+    @cache_figure("pie-chart")
+    def update_pie_chart(json, product, colour, view):
+        # Aggregates and cumulative count index of the product, with a count per interned failure code
+        aggregates = load_aggregates(json)
+        range_index = load_range_index(json)
         
-        colours_options = [colour for colour in df["Material Colour"].unique()]
+        colours_options = list(aggregates.colours)
         colours_options.append("All")
 
-        # Initiate dates
-        if end_date == None:
-            end_date = str(datetime.today()).split(" ")[0]
-        if start_date == None:
-            start_date = df.iloc[:, 0][1].split("T")[0]
+        # Dates of the selected view
+        start_date, end_date = view_dates(view)
 
-        df = df[start_date:end_date]
-        
-        if colour != "All":
-            df = df.loc[df['Material Colour'] == colour]
+        # Number of batches with each failure code in the selected dates and colour
+        failure_code_no = {}
+        if colour in range_index:
+            prefix = range_index[colour]
+            totals = range_totals(prefix, start_date, end_date)
+            failure_code_no = {code: totals[code] for code in prefix.codes if totals[code] > 0}
 
         colours = ['#d95f02', '#1b9e77', '#7570b3', '#e7298a', '#66a61e','#e6ab02','#a6761d', "#232323"]
 
-        if len(df['Failure code'].unique()) > 1:
-            
-            failure_code_no = {}
-            
-            for value in df["Failure code"].unique():
-                if value != None:
-                    no = len(df.loc[df["Failure code"] == value])
-                    if len(value.split(",")) > 1:
-                        for code in value.split(","):
-                            failure_code_no[code.upper()] = no + failure_code_no.get(code.upper(), 0)
-                    else:
-                        failure_code_no[value.upper()] = no + failure_code_no.get(value.upper(), 0)
-                            
+        if len(failure_code_no) > 0:
             
             labels = [key for key in failure_code_no.keys()]
             values = [failure_code_no[label] for label in labels]
 
-            for code in labels:
-                values.append(len(df.loc[df['Failure code'] == code]))
-
-            fig = go.Figure(data=[go.Pie(labels=[label.upper()
-                            for label in labels], values=values)])
+            fig = go.Figure(data=[go.Pie(labels=labels, values=values)])
 
             fig.update_traces(textposition='inside', textinfo='percent+label+value',
                             marker=dict(colors=colours, line=dict(color='rgb(75,75,75)', width=1)))
@@ -92,6 +77,9 @@ def failure_pie_chart_callback(app, colours):
 
             return fig, f"{product} Failure Codes ", colours_options
         else:
+            # Imported on first use so the server doesn't wait on plotly.express to start
+            import plotly.express as px
+
             fig = px.scatter_3d().add_annotation(text="No Failures to Report",
                                                 showarrow=False, font={"size": 34})
 
@@ -119,4 +107,4 @@ def failure_pie_chart_callback(app, colours):
                 font_family="Abel"
             )
             
-            return fig, f"{product} Failure Codes ", colours_options
\ No newline at end of file
+            return fig, f"{product} Failure Codes ", colours_options
\ No newline at end of file
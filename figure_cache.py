@@ -0,0 +1,89 @@
+# Data handling
+import json
+from datetime import date
+from functools import wraps
+from threading import Lock
+
+# Data visualisation
+from plotly.utils import PlotlyJSONEncoder
+
+# Dashboard modules
+from dash import callback_context, no_update
+from dash.exceptions import PreventUpdate
+
+# Imports from other files
+from figure_patch import patch_figure
+from build_memo import BuildMemo
+
+# Number of callback results kept in the figure cache
+FIGURE_CACHE_SIZE = 128
+# Data versions of a workbook whose figures are kept: the latest, and the one before it that patches are built from
+VERSIONS_KEPT = 2
+# Inputs that change when new data is published. A figure is only patched when nothing else triggered its callback
+DATA_INPUTS = {"memory", "memory-title", "memory-limits"}
+
+# Key: (Figure name, Filename, version, inputs, day) => Value: callback outputs, with the figure as the browser receives it
+_figures = BuildMemo(FIGURE_CACHE_SIZE)
+# Key: Filename => Value: data versions with cached figures, latest last
+_versions = {}
+_lock = Lock()
+
+# Figure as the browser receives it, with numpy arrays, dates and so on converted to JSON types
+def figure_json(fig):
+    return json.loads(json.dumps(fig, cls=PlotlyJSONEncoder))
+
+# Cache key of a figure built from a data version and the other inputs of its callback, on today's date
+def figure_token(name, key, version, inputs):
+    return (name, key["file"], version, json.dumps(inputs, sort_keys=True, default=str), str(date.today()))
+
+# Records a data version of a workbook, dropping the figures of versions older than VERSIONS_KEPT
+def remember_version(filename, version):
+    with _lock:
+        versions = _versions.setdefault(filename, [])
+        if version in versions:
+            return
+        versions.append(version)
+        stale = versions[:-VERSIONS_KEPT]
+        del versions[:-VERSIONS_KEPT]
+    _figures.forget(lambda token: token[1] == filename and token[2] in stale)
+
+"""
+Returns the outputs of a figure callback for a data version and inputs, building them once for every viewer
+build() runs the callback. Its first output is the figure, which is kept as the browser receives it
+
+"""
+def load_outputs(name, key, inputs, build):
+    def build_outputs():
+        outputs = list(build())
+        outputs[0] = figure_json(outputs[0])
+        remember_version(key["file"], key["version"])
+        return outputs
+    return _figures.load(figure_token(name, key, key["version"], inputs), build_outputs)
+
+"""
+Decorator caching a figure callback in the shared figure cache
+The callback takes the memory dcc.Store key first and returns the figure first. Nothing is built until a key is published
+With patch=True, a callback triggered only by new data sends a Patch of the figure built from the version the browser
+last received (key["previous"]), when that figure is still cached, instead of the whole figure
+
+"""
+def cache_figure(name, patch=False):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(key, *inputs):
+            if key is None:
+                raise PreventUpdate
+            outputs = load_outputs(name, key, inputs, lambda: function(key, *inputs))
+
+            if patch and key.get("previous") is not None and \
+                    set(callback_context.triggered_prop_ids.values()) <= DATA_INPUTS:
+                previous = _figures.get(figure_token(name, key, key["previous"], inputs))
+                if previous is not None:
+                    if previous[0] == outputs[0]:
+                        return (no_update, *outputs[1:])
+                    figure_patch = patch_figure(previous[0], outputs[0])
+                    if figure_patch is not None:
+                        return (figure_patch, *outputs[1:])
+            return tuple(outputs)
+        return wrapper
+    return decorator
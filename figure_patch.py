@@ -0,0 +1,62 @@
+# Dashboard modules
+from dash import Patch
+
+# Share of a trace array that may change before the whole array is sent instead
+PATCH_RATIO = 0.5
+
+"""
+Adds the operations turning the old array into the new one to a Patch of the array
+Points added to the end (trend graphs) are extended and points added to the start (latest first bucket graphs) are
+prepended. Points that changed in place, like the current week, are set one by one
+Returns False when too much changed, in which case nothing was added
+
+"""
+def patch_array(target, old, new):
+    added = len(new) - len(old)
+    if added < 0:
+        return False
+
+    # Try points added to the end, then to the start
+    for offset in (0, added):
+        changed = [position for position, value in enumerate(old) if new[offset + position] != value]
+        if len(changed) <= len(old) * PATCH_RATIO:
+            for position in changed:
+                target[position] = new[offset + position]
+            if offset == 0:
+                if added:
+                    target.extend(new[len(old):])
+            else:
+                for value in reversed(new[:added]):
+                    target.prepend(value)
+            return True
+        if added == 0:
+            break
+    return False
+
+"""
+Builds a Patch turning the old figure into the new one, both as the browser receives them (see figure_cache.figure_json)
+Returns None when the traces were added, removed or reordered, so the figure is sent in full
+
+"""
+def patch_figure(old, new):
+    old_data = old.get("data", [])
+    new_data = new.get("data", [])
+    if [(trace.get("type"), trace.get("name")) for trace in old_data] != \
+            [(trace.get("type"), trace.get("name")) for trace in new_data]:
+        return None
+
+    patch = Patch()
+    for position, (old_trace, new_trace) in enumerate(zip(old_data, new_data)):
+        for attribute in old_trace.keys() - new_trace.keys():
+            del patch["data"][position][attribute]
+        for attribute, value in new_trace.items():
+            previous = old_trace.get(attribute)
+            if previous == value:
+                continue
+            if not (isinstance(previous, list) and isinstance(value, list) and
+                    patch_array(patch["data"][position][attribute], previous, value)):
+                patch["data"][position][attribute] = value
+
+    if old.get("layout") != new.get("layout"):
+        patch["layout"] = new.get("layout")
+    return patch
@@ -0,0 +1,106 @@
+# File sharing and data handling modules
+import os
+from threading import Event, Thread
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Imports from other files
+from product_cache import product_cache, load_workbook, workbook_fingerprint
+from shared_cache import refresh_lock
+from data_store import share_product
+
+# Seconds between prefetch passes over the products directory
+PREFETCH_INTERVAL = 60
+
+# Runs in a worker process. Parses a product workbook, preferring its parquet sidecar, and returns the result to the dashboard process
+def parse_workbook(filename, fingerprint, previous=None):
+    df, limits, state = load_workbook(filename, fingerprint, previous)
+    return filename, fingerprint, df, limits, state
+
+"""
+Background worker that keeps every product returned by product_files() warm in the product cache
+At start up and then every interval seconds the products are looked up and their workbooks stat'ed, and any product
+missing from the cache or changed since it was cached is parsed in parallel across worker processes. Results are
+put in the in-process product cache and shared with every dashboard worker through share_product, so switching products
+doesn't wait on Excel parsing
+When lock_path is passed, the lock file taken for the prefetcher is refreshed before every pass so it isn't taken over
+
+"""
+class ProductPrefetcher:
+    def __init__(self, cache=product_cache, interval=PREFETCH_INTERVAL, max_workers=None):
+        self.cache = cache
+        self.interval = interval
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.product_files = dict
+        self.lock_path = None
+        self._pool = None
+        self._thread = None
+        self._stop = Event()
+
+    def start(self, product_files, lock_path=None):
+        self.product_files = product_files
+        self.lock_path = lock_path
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="product-prefetch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.lock_path is not None:
+                refresh_lock(self.lock_path)
+            self.prefetch()
+            self._stop.wait(self.interval)
+
+    # One pass over the products. Returns the number of products that were parsed
+    def prefetch(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        product_file_dict = self.product_files()
+        # Keep room in the cache for every product
+        self.cache.maxsize = max(self.cache.maxsize, len(product_file_dict))
+
+        futures = {}
+        for filename in product_file_dict.values():
+            try:
+                fingerprint = workbook_fingerprint(filename)
+            except OSError as error:
+                print(f"\nUnable to prefetch {filename}: {error}")
+                continue
+            if self.cache.cached_fingerprint(filename) != fingerprint:
+                future = self._pool.submit(parse_workbook, filename, fingerprint, self.cache.previous(filename))
+                futures[future] = filename
+
+        parsed = 0
+        for future in as_completed(futures):
+            try:
+                filename, fingerprint, df, limits, state = future.result()
+            except BrokenProcessPool:
+                # A worker died. Start a fresh pool on the next pass
+                print(f"\nPrefetch worker pool stopped while parsing {futures[future]}")
+                self._pool = None
+                break
+            except Exception as error:
+                print(f"\nUnable to prefetch {futures[future]}: {error}")
+                continue
+            self.cache.put(filename, fingerprint, df, limits, state)
+            try:
+                share_product(filename, fingerprint)
+            except Exception as error:
+                print(f"\nUnable to share {filename}: {error}")
+            parsed += 1
+        return parsed
+
+
+# Shared prefetcher used by the dashboard
+product_prefetcher = ProductPrefetcher()
+
+# Starts warming every product returned by product_files(), a function returning the Key: Product => Value: Filename dict
+def start_prefetch(product_files, lock_path=None):
+    product_prefetcher.start(product_files, lock_path)
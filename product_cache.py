@@ -0,0 +1,127 @@
+# File sharing and data handling modules
+import os
+from collections import OrderedDict, namedtuple
+from threading import RLock
+
+# Imports from other files
+from data_pipeline import PRODUCTS_PATH, ingest_product_data
+from sidecar_cache import read_sidecar, write_sidecar, sidecar_path
+from shared_cache import file_lock
+
+# Hit/miss counters reported by the product cache
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"])
+
+# Full path of a product workbook in the products directory
+def workbook_path(filename):
+    return os.path.join(PRODUCTS_PATH, filename)
+
+# Returns the (modification time, size) stamp of a product workbook in the products directory
+def workbook_fingerprint(filename):
+    stat = os.stat(workbook_path(filename))
+    return stat.st_mtime_ns, stat.st_size
+
+"""
+Loads a product workbook. The parquet sidecar is used when it was written for the workbook's current stamp
+Otherwise the workbook is read, processing only the rows appended since previous=(df, limits, state) when it is passed
+Only one worker process reads a workbook at a time. The others wait for its sidecar rather than reading it again
+Returns dataframe, conforming limits and ingest state
+
+"""
+def load_workbook(filename, fingerprint, previous=None):
+    cached = read_sidecar(workbook_path(filename), fingerprint)
+    if cached is not None:
+        return cached
+
+    with file_lock(f"{sidecar_path(workbook_path(filename))}.lock"):
+        # Another worker may have written the sidecar while this one waited
+        cached = read_sidecar(workbook_path(filename), fingerprint)
+        if cached is not None:
+            return cached
+        df, limits, state = ingest_product_data(filename, previous=previous)
+        write_sidecar(workbook_path(filename), fingerprint, df, limits, state)
+    return df, limits, state
+
+"""
+Change aware cache in front of process_product_data
+Stats the product workbook on every lookup and returns the already processed dataframe and limits when the
+modification time and size are unchanged. Products are evicted least recently used first once maxsize is reached
+On a miss the parquet sidecar is tried before the Excel workbook, so restarts don't pay the Excel parse again
+When a cached product's workbook changed only the appended rows are processed and merged into the cached frame
+
+"""
+class ProductCache:
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Key: Filename => Value: (fingerprint, df, limits, ingest state)
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, filename):
+        fingerprint, df, limits = self.lookup(filename)
+        return df, limits
+
+    # Returns the workbook fingerprint the dataframe and limits were processed from, along with them
+    def lookup(self, filename):
+        fingerprint = workbook_fingerprint(filename)
+
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry[0] == fingerprint:
+                self.hits += 1
+                self._entries.move_to_end(filename)
+                return entry[0], entry[1], entry[2]
+            self.misses += 1
+
+        print(f"\nProduct cache miss for {filename}. {self.cache_info()}")
+        df, limits, state = load_workbook(filename, fingerprint, self.previous(filename))
+        self.put(filename, fingerprint, df, limits, state)
+        return fingerprint, df, limits
+
+    def put(self, filename, fingerprint, df, limits, state=None):
+        with self._lock:
+            self._entries[filename] = (fingerprint, df, limits, state)
+            self._entries.move_to_end(filename)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # The (df, limits) cached for a product when they were processed from fingerprint, otherwise None. Not counted as a lookup
+    def cached(self, filename, fingerprint):
+        with self._lock:
+            entry = self._entries.get(filename)
+        if entry is None or entry[0] != fingerprint:
+            return None
+        return entry[1], entry[2]
+
+    def cached_fingerprint(self, filename):
+        with self._lock:
+            entry = self._entries.get(filename)
+        return None if entry is None else entry[0]
+
+    # The (df, limits, state) last cached for a product, to merge appended rows into
+    def previous(self, filename):
+        with self._lock:
+            entry = self._entries.get(filename)
+        return None if entry is None else entry[1:]
+
+    def invalidate(self, filename=None):
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(filename, None)
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._entries))
+
+
+# Shared cache used by the dashboard
+product_cache = ProductCache()
+
+# Returns dataframe and conforming limits for the product workbook, only processing the workbook when it has changed
+def load_product_data(filename):
+    return product_cache.get(filename)
@@ -0,0 +1,115 @@
+# File sharing and data handling modules
+import os
+import json
+from threading import Event, Lock, Thread
+
+# Imports from other files
+from data_pipeline import PRODUCTS_PATH
+from sidecar_cache import CACHE_PATH
+from atomic_file import atomic_file
+
+# Local file keeping the last listing of the products directory, so start up doesn't wait on the share
+INDEX_PATH = os.path.join(CACHE_PATH, "products.json")
+# Seconds between listings of the products directory
+DISCOVERY_INTERVAL = 300
+
+# Product name of a QC check sheet, the first two words of its filename
+def product_name(filename):
+    return " ".join(filename.split(" ")[:2])
+
+# Lists the products directory. Returns a dict of Key: Product => Value: Filename, in directory order
+def scan_products(path=PRODUCTS_PATH):
+    product_file_dict = {}
+    for filename in os.listdir(path):
+        product_file_dict[product_name(filename)] = filename
+    return product_file_dict
+
+# Reads the last listing of the products directory. Returns an empty dict when there is none
+def read_index(path=INDEX_PATH):
+    try:
+        with open(path, encoding="utf-8") as index_file:
+            return dict(json.load(index_file))
+    except (OSError, ValueError, TypeError):
+        return {}
+
+# Writes a listing of the products directory
+def write_index(product_file_dict, path=INDEX_PATH):
+    try:
+        with atomic_file(path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as index_file:
+                json.dump(product_file_dict, index_file, indent=4)
+    except OSError as error:
+        print(f"\nUnable to write product index: {error}")
+        return False
+    return True
+
+"""
+Products available to the dashboard, discovered without holding up start up
+Starts from the listing persisted by the last run, then lists the products directory in the background every interval
+seconds, persisting the listing whenever products are added or removed. listed is set once this process has listed it
+
+"""
+class ProductIndex:
+    def __init__(self, path=INDEX_PATH, interval=DISCOVERY_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.listed = Event()
+        # Key: Product => Value: Filename
+        self._files = read_index(path)
+        self._lock = Lock()
+        self._thread = None
+        self._stop = Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="product-discovery", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    # Lists the products directory. Returns False when it couldn't be listed, keeping the products known so far
+    def refresh(self):
+        try:
+            product_file_dict = scan_products()
+        except OSError as error:
+            print(f"\nUnable to list products: {error}")
+            return False
+
+        with self._lock:
+            changed = product_file_dict != self._files
+            self._files = product_file_dict
+        self.listed.set()
+        if changed:
+            write_index(product_file_dict, self.path)
+        return True
+
+    # Current Key: Product => Value: Filename dict
+    def files(self):
+        with self._lock:
+            return dict(self._files)
+
+    def products(self):
+        return list(self.files())
+
+    # Filename of a product. A product missing from the persisted listing is looked for on the share once
+    # Returns None when the product isn't listed, for example when its workbook has been removed from the share
+    def filename(self, product):
+        product_file_dict = self.files()
+        if product not in product_file_dict and not self.listed.is_set():
+            self.refresh()
+            product_file_dict = self.files()
+        return product_file_dict.get(product)
+
+
+# Shared product index used by the dashboard
+product_index = ProductIndex()
+
+# Starts listing the products directory in the background
+def start_discovery():
+    product_index.start()
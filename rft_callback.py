@@ -1,23 +1,17 @@
-# File sharing
-from sys import displayhook
-
 # Data handling
-import numpy as np
-import pandas as pd
-from datetime import date
-from datetime import timedelta
-from datetime import datetime
-import math
 from itertools import cycle
 
 # Data visualisation
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 # Dashboard modules
 from dash import Input, Output
 
+# Imports from other files
+from data_store import load_aggregates, view_dates
+from aggregates import GRANULARITIES, time_buckets, pass_rate
+from figure_cache import cache_figure
+
 
 def rft_callback(app, colours):
     # Callback function gets called whenever the product drop down value changes
@@ -28,63 +22,42 @@ def rft_callback(app, colours):
         # Uses the value attribute from the product-drop-down component as the argument for the below function
         Input('memory', 'data'),
         Input("memory-title", "data"),
-        # Start data parameter
-        Input('date-selector', "start_date"),
-        # End date parameter
-        Input('date-selector', "end_date")
+        # Date range parameter
+        Input("memory-view", "data"),
+        # Time bucket parameter
+        Input("granularity-selector", "value")
     )
-    def update_weekly_rft(json, title, start_date, end_date):
-        # Process corresponding product QC data
-        df = pd.read_json(json, orient='split')
+    # Built once per data version and inputs for every viewer, and patched when only new batches arrived
+    @cache_figure("weekly-right-first-time", patch=True)
+    def update_weekly_rft(json, title, view, granularity):
+        # Imported on first use so the server doesn't wait on plotly.subplots to start
+        from plotly.subplots import make_subplots
+
+        # Aggregate cube of the corresponding product QC data
+        aggregates = load_aggregates(json)
+        start_date, curr_date = view_dates(view)
 
         # Check if product has 1 or more colours
-        if len(df['Material Colour'].unique()) == 1:
+        if len(aggregates.colours) == 1:
             # Declare axis values
             pass_rates = []
             batches = []
-            weeks = []
-
-            # Initiate dates
-            if end_date == None:
-                curr_date = str(datetime.today()).split(" ")[0]
-            else:
-                curr_date = end_date
-
-            if start_date == None:
-                start_date = df.iloc[:, 0][1].split("T")[0]
-
-        # Loop through weeks from todays date until there is no longer data
-            while curr_date > start_date:
-                curr_date_dt = datetime.strptime(curr_date, "%Y-%m-%d")
-                monday_date = curr_date_dt - timedelta(days=curr_date_dt.weekday())
-
-                df_sliced = df[str(monday_date): str(curr_date)]
-
-                try:
-                    pass_rate = df_sliced['Result'].value_counts(
-                        normalize=True)['Pass']*100
-                except KeyError:
-                    if len(df_sliced) > 0:
-                        pass_rate = 0
-                    else:
-                        pass_rate = np.nan
-
-                # Only append data that is available
-                if not math.isnan(pass_rate):
-                    pass_rates.append(pass_rate)
-                    weeks.append(monday_date)
-                    batches.append(len(df_sliced))
-
-                # Push current date to last week
-                curr_date = str(monday_date - timedelta(days=1)).split(" ")[0]
+            periods = []
+
+            # Counts per time bucket, latest first. Buckets without data aren't returned
+            counts = time_buckets(aggregates.cube, granularity, start_date, curr_date).groupby(level="bucket", sort=False).sum()
+            for period, passes, batch_count in zip(counts.index, counts["passes"].to_numpy(), counts["batches"].to_numpy()):
+                pass_rates.append(pass_rate(passes, batch_count))
+                periods.append(period)
+                batches.append(batch_count)
 
             # Initiate figure
             fig = make_subplots(specs=[[{"secondary_y": True}]])
 
             # Add line and bar charts
-            fig.add_trace(go.Bar(x=weeks, y=batches, name="Batches",
+            fig.add_trace(go.Bar(x=periods, y=batches, name="Batches",
                                 marker_color=colours["marker"],), secondary_y=False)
-            fig.add_trace(go.Scatter(x=weeks, y=pass_rates, name="Right First Time",
+            fig.add_trace(go.Scatter(x=periods, y=pass_rates, name="Right First Time",
                                     line=dict(color=colours["accent"], width=2,),
                                     marker=dict(size=10), mode="lines+markers", connectgaps=True), secondary_y=True)
             
@@ -117,60 +90,34 @@ def rft_callback(app, colours):
             )
 
             # Return fig
-            return fig, f"{title} Weekly Right First Time"
+            return fig, f"{title} {GRANULARITIES[granularity]} Right First Time"
         else:
             fig = make_subplots(specs=[[{"secondary_y": True}]])
 
             palette = cycle(
                 ['#d95f02', '#1b9e77', '#7570b3', '#e7298a', '#66a61e','#e6ab02','#a6761d', "#232323"])
 
-            # Initiate start date
-            if start_date == None:
-                start_date = df.iloc[:, 0][1].split("T")[0]
-            else:
-                start_date = start_date
-
-            for colour in df["Material Colour"].unique():
-                # Initiate end date
-                if end_date == None:
-                    curr_date = str(datetime.today()).split(" ")[0]
-                else:
-                    curr_date = end_date
+            # Counts per time bucket and colour, latest first
+            counts = time_buckets(aggregates.cube, granularity, start_date, curr_date)
+            colour_counts = {colour: frame.droplevel("colour") for colour, frame in counts.groupby(level="colour", sort=False)}
 
+            for colour in aggregates.colours:
                 pass_rates = []
                 batches = []
-                weeks = []
-
-                while curr_date > start_date:
-                    curr_date_dt = datetime.strptime(curr_date, "%Y-%m-%d")
-                    monday_date = curr_date_dt - \
-                        timedelta(days=curr_date_dt.weekday())
-
-                    df_sliced = df[str(monday_date): str(curr_date)]
-
-                    try:
-                        pass_rate = df_sliced.groupby('Material Colour')['Result'].value_counts(
-                            normalize=True)[colour]['Pass'] * 100
-                    except KeyError:
-                        if len(df_sliced.loc[df_sliced['Material Colour'] == colour]) > 0:
-                            pass_rate = 0
-                        else:
-                            pass_rate = np.nan
-
-                    # Only append data that is available
-                    if not math.isnan(pass_rate):
-                        pass_rates.append(pass_rate)
-                        weeks.append(monday_date)
-                        batches.append(
-                            len(df_sliced.loc[df_sliced['Material Colour'] == colour]))
+                periods = []
 
-                    curr_date = str(monday_date - timedelta(days=1)).split(" ")[0]
+                if colour in colour_counts:
+                    frame = colour_counts[colour]
+                    for period, passes, batch_count in zip(frame.index, frame["passes"].to_numpy(), frame["batches"].to_numpy()):
+                        pass_rates.append(pass_rate(passes, batch_count))
+                        periods.append(period)
+                        batches.append(batch_count)
 
                 curr_colour = next(palette)
 
-                fig.add_trace(go.Bar(x=weeks, y=batches,
+                fig.add_trace(go.Bar(x=periods, y=batches,
                             name=colour + " Batches", marker_color=curr_colour), secondary_y=False)
-                fig.add_trace(go.Scatter(x=weeks, y=pass_rates, name=colour + " RFT",
+                fig.add_trace(go.Scatter(x=periods, y=pass_rates, name=colour + " RFT",
                                         line=dict(color=curr_colour, width=2,), marker=dict(size=10), mode='lines+markers', connectgaps=True), secondary_y=True)
 
             fig.data = fig.data[::-1]
@@ -203,4 +150,4 @@ def rft_callback(app, colours):
                 font_family="Abel"
             )
 
-            return fig, f"{title} Weekly Right First Time"
\ No newline at end of file
+            return fig, f"{title} {GRANULARITIES[granularity]} Right First Time"
\ No newline at end of file
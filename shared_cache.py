@@ -0,0 +1,194 @@
+# File sharing and data handling modules
+import os
+import time
+import pickle
+import atexit
+import hashlib
+from threading import Event, Thread, get_ident
+from contextlib import contextmanager
+
+# Imports from other files
+from sidecar_cache import CACHE_PATH
+from atomic_file import atomic_file, remove_others
+
+# Seconds a process waits for another one to finish building before building itself
+LOCK_TIMEOUT = 300
+# Seconds after which a lock file is taken to be left behind by a process that died while holding it. Shorter than
+# LOCK_TIMEOUT so waiters break the lock of a dead worker on platforms where its process can't be looked up
+LOCK_STALE = 120
+# Seconds between checks of a lock held by another process
+LOCK_POLL = 0.2
+# Seconds between refreshes of a lock file while it is held, well within LOCK_STALE
+LOCK_REFRESH = LOCK_STALE / 4
+
+# Owner written to a lock file taken by this thread: the pid of the process, then the thread
+def lock_owner():
+    return f"{os.getpid()} {get_ident()}"
+
+# Tries to create the lock file for owner. Returns False when another process or thread holds it
+def try_lock(path, owner):
+    try:
+        descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(descriptor, "w") as lock_file:
+        lock_file.write(owner)
+    return True
+
+# Whether the process that wrote its pid to a lock file is still running. Only known on POSIX, elsewhere it is assumed to be
+def holder_alive(path):
+    try:
+        with open(path) as lock_file:
+            pid = int(lock_file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        # Released, or taken but the pid not written yet
+        return True
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# Seconds since a lock file was taken or last refreshed, 0 when it has just been released
+def lock_age(path):
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return 0
+
+"""
+Lock held across the worker processes of the dashboard, and the threads within them, through a lock file
+The file is created exclusively, which works on local disks and network shares on Windows and Linux alike
+Yields True once the lock is held, or False when it couldn't be taken within timeout seconds or the cache directory
+can't be written, in which case the caller carries on without it
+While held, the lock file is refreshed every LOCK_REFRESH seconds, however long the caller takes. The lock of a holder
+that is no longer running, or that hasn't been refreshed for LOCK_STALE seconds, is broken straight away
+
+"""
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    owner = lock_owner()
+    locked = False
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        while not try_lock(path, owner):
+            if lock_age(path) > LOCK_STALE or not holder_alive(path):
+                print(f"\nRemoving stale lock {path}")
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if time.monotonic() > deadline:
+                print(f"\nTimed out waiting for lock {path}")
+                break
+            time.sleep(LOCK_POLL)
+        else:
+            locked = True
+    except OSError as error:
+        print(f"\nUnable to take lock {path}: {error}")
+
+    released = Event()
+    if locked:
+        Thread(target=keep_lock, args=(path, released), name="lock-refresh", daemon=True).start()
+    try:
+        yield locked
+    finally:
+        released.set()
+        if locked:
+            release_lock(path, owner)
+
+# Refreshes a lock file every LOCK_REFRESH seconds until released is set
+def keep_lock(path, released):
+    while not released.wait(LOCK_REFRESH):
+        refresh_lock(path)
+
+"""
+Takes a lock file for the rest of the process's life, such as the lock of the one worker that prefetches products
+Returns False when another running process holds it. The holder marks it as held with refresh_lock, so elsewhere than
+on POSIX it is taken to be left behind once it hasn't been refreshed for LOCK_STALE seconds. Released on exit
+
+"""
+def claim_lock(path):
+    owner = lock_owner()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not try_lock(path, owner):
+            if holder_alive(path) and (os.name == "posix" or lock_age(path) <= LOCK_STALE):
+                return False
+            print(f"\nRemoving stale lock {path}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            if not try_lock(path, owner):
+                return False
+    except OSError as error:
+        print(f"\nUnable to take lock {path}: {error}")
+        return False
+    atexit.register(release_lock, path, owner)
+    return True
+
+# Marks a lock taken with claim_lock as still held
+def refresh_lock(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+# Releases a lock taken by owner, unless another process or thread has since taken it over
+def release_lock(path, owner):
+    try:
+        with open(path) as lock_file:
+            held = lock_file.read() == owner
+        if held:
+            os.remove(path)
+    except OSError:
+        pass
+
+# Path prefix of the shared files of an object derived from a workbook. The data version is appended to it
+def shared_prefix(filename, name):
+    digest = hashlib.sha1(repr((filename, name)).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_PATH, digest)
+
+# Path of the shared file of an object derived from a data version of a workbook
+def shared_path(filename, version, name):
+    return f"{shared_prefix(filename, name)}-{version}.pickle"
+
+"""
+Reads an object derived from a data version of a workbook (aggregate cube, indexes, histograms) written by any worker
+Returns None when no worker has written it yet or the file can't be read
+
+"""
+def read_shared(filename, version, name):
+    path = shared_path(filename, version, name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as shared_file:
+            return pickle.load(shared_file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as error:
+        print(f"\nUnable to read shared {name} for {filename}: {error}")
+        return None
+
+"""
+Writes an object derived from a data version of a workbook for the other workers, removing older versions of it
+
+"""
+def write_shared(filename, version, name, value):
+    path = shared_path(filename, version, name)
+    try:
+        with atomic_file(path) as tmp_path:
+            with open(tmp_path, "wb") as shared_file:
+                pickle.dump(value, shared_file, protocol=pickle.HIGHEST_PROTOCOL)
+    except (OSError, pickle.PicklingError, TypeError) as error:
+        print(f"\nUnable to write shared {name} for {filename}: {error}")
+        return False
+
+    remove_others(f"{shared_prefix(filename, name)}-*.pickle", path)
+    return True
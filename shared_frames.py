@@ -0,0 +1,87 @@
+# File sharing and data handling modules
+import os
+import hashlib
+import pandas as pd
+
+# Imports from other files
+from sidecar_cache import CACHE_PATH, pa
+from atomic_file import atomic_file, remove_others
+
+# Column of the Arrow file holding the index of the frame
+INDEX_COLUMN = "__index__"
+
+# Path prefix of the Arrow files of a workbook. The data version is appended to it
+def frame_prefix(filename):
+    digest = hashlib.sha1(repr(("frame", filename)).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_PATH, digest)
+
+# Path of the Arrow file of a data version of a workbook
+def frame_path(filename, version):
+    return f"{frame_prefix(filename)}-{version}.arrow"
+
+"""
+Converts a decoded product frame to an Arrow table, with the index as its first column
+Categorical text becomes a dictionary array, with missing text as null. Dates are timestamps, and NaN is kept as a float
+value so numeric columns have no validity bitmap. Both can then be viewed in place by every worker
+
+"""
+def frame_table(df):
+    arrays = [pa.array(df.index.to_numpy())]
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            arrays.append(pa.array(df[column], from_pandas=True))
+        else:
+            arrays.append(pa.array(df[column].to_numpy()))
+    return pa.Table.from_arrays(arrays, names=[INDEX_COLUMN, *df.columns])
+
+"""
+Converts an Arrow table back to the decoded product frame
+Numeric and date columns become read only views of the table's buffers, one block per column so pandas doesn't copy
+them into a combined block. Dictionary columns become categoricals, whose values are only converted to Python strings once
+
+"""
+def table_frame(table):
+    df = table.drop([INDEX_COLUMN]).to_pandas(split_blocks=True)
+    df.index = pd.Index(table.column(INDEX_COLUMN).to_numpy())
+    return df
+
+"""
+Writes the decoded frame of a data version of a workbook as an uncompressed Arrow IPC file, removing older versions
+Returns False when pyarrow is not installed or the frame holds values Arrow can't represent
+
+"""
+def publish_frame(filename, version, df):
+    if pa is None:
+        return False
+
+    path = frame_path(filename, version)
+    try:
+        table = frame_table(df)
+        with atomic_file(path) as tmp_path:
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+    except (OSError, TypeError, ValueError, pa.ArrowException) as error:
+        print(f"\nUnable to share frame of {filename}: {error}")
+        return False
+
+    # Workers still attached to an older version keep their mapping. On Windows the file stays until they let go
+    remove_others(f"{frame_prefix(filename)}-*.arrow", path)
+    return True
+
+"""
+Attaches to the Arrow file of a data version of a workbook through a read only memory map
+The pages are shared by every worker process through the operating system's page cache, so nothing is copied or
+deserialized for the numeric and date columns. Returns None when no worker has published the version
+
+"""
+def attach_frame(filename, version):
+    path = frame_path(filename, version)
+    if pa is None or not os.path.exists(path):
+        return None
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    except (OSError, pa.ArrowException) as error:
+        print(f"\nUnable to attach to frame of {filename}: {error}")
+        return None
+    return table_frame(table)
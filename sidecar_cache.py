@@ -0,0 +1,77 @@
+# File sharing and data handling modules
+import os
+import json
+import hashlib
+
+# Imports from other files
+from data_pipeline import IngestState
+from atomic_file import atomic_file
+
+# Parquet support is optional. Without pyarrow every load falls back to reading the Excel workbook
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Local directory holding the parsed product sheets. Set QC_CACHE_PATH to keep them in another directory
+CACHE_PATH = os.path.abspath(os.environ.get("QC_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")))
+
+# Schema metadata key holding the source workbook stamp, conforming limits and ingest state
+METADATA_KEY = b"qc_dashboard"
+
+# Path of the parquet sidecar for a workbook. Named after a hash of the workbook path so products never collide
+def sidecar_path(workbook_path):
+    digest = hashlib.sha1(os.path.abspath(workbook_path).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_PATH, f"{digest}.parquet")
+
+"""
+Reads the cleaned dataframe, conforming limits and ingest state of a workbook from its parquet sidecar
+Returns None when there is no sidecar, pyarrow is not installed or the sidecar was written for a different
+modification stamp of the workbook
+
+"""
+def read_sidecar(workbook_path, fingerprint):
+    path = sidecar_path(workbook_path)
+    if pq is None or not os.path.exists(path):
+        return None
+
+    try:
+        table = pq.read_table(path)
+        metadata = json.loads(table.schema.metadata[METADATA_KEY])
+    except (OSError, KeyError, ValueError, pa.ArrowException):
+        return None
+
+    if metadata["source"] != os.path.abspath(workbook_path) or tuple(metadata["fingerprint"]) != tuple(fingerprint):
+        return None
+
+    state = metadata.get("state")
+    return table.to_pandas(), metadata["limits"], None if state is None else IngestState(**state)
+
+"""
+Writes the cleaned dataframe, conforming limits and ingest state of a workbook to its parquet sidecar, in one step
+Frames parquet can't represent (mixed object columns, non string labels) are skipped
+
+"""
+def write_sidecar(workbook_path, fingerprint, df, limits, state=None):
+    if pq is None:
+        return False
+
+    metadata = {
+        "source": os.path.abspath(workbook_path),
+        "fingerprint": list(fingerprint),
+        "limits": limits,
+        "state": None if state is None else state._asdict(),
+    }
+
+    try:
+        table = pa.Table.from_pandas(df)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata)})
+        with atomic_file(sidecar_path(workbook_path)) as tmp_path:
+            pq.write_table(table, tmp_path)
+    except (OSError, TypeError, ValueError, pa.ArrowException) as error:
+        print(f"\nUnable to write sidecar for {workbook_path}: {error}")
+        return False
+    return True
@@ -1,19 +1,17 @@
 # Data handling
 import numpy as np
-import pandas as pd
-from datetime import date
-from datetime import timedelta
-from datetime import datetime
-import math
-from itertools import cycle
-
-# Data visualisation
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 # Dashboard modules
-from dash import Dash, Input, Output, html, dcc
+from dash import Input, Output
+from dash.exceptions import PreventUpdate
+
+# Imports from other files
+from data_store import load_view
+from figure_cache import cache_figure
+from downsample import downsample_trend
+
+# Most batches drawn in the trend graph. Longer ranges are downsampled and drawn with WebGL
+TREND_MAX_POINTS = 2000
 
 def spec_trend_graph_callback(app, colours):
         # Callback function to update options attribute for specificationDropDown component using the product data columns
@@ -21,17 +19,17 @@ def spec_trend_graph_callback(app, colours):
         # Updates options attribute for the specificationDropwDown component
         Output("spec-drop-down-trend", "options"),
         Output("colour-drop-down-2", "options"),
-        Input("memory", "data")
+        Input("memory-schema", "data")
     )
-    # Function to retrieve column names from the QC product data
-    def spec_options(product):
-        # Extract df from product and retrieve columns
-        df = pd.read_json(product, orient='split')
-        
-        columns = [column for column in df.columns if df.dtypes[column]
-                == "int64" or df.dtypes[column] == "float64"]
+    # Function to retrieve column names from the QC product schema record
+    def spec_options(schema):
+        # No product published yet, on a first start before the products directory has been listed
+        if schema is None:
+            raise PreventUpdate
+        # Numeric specification columns and colours of the product
+        columns = list(schema["specs"])
         
-        colours = [colour for colour in df["Material Colour"].unique()]
+        colours = list(schema["colours"])
         colours.append("All")
         
         return columns, colours
@@ -47,33 +45,36 @@ def spec_trend_graph_callback(app, colours):
     # The value attribute for the spec-drop-down element is the argument for the below function
     Input('spec-drop-down-trend', 'value'),
     Input('colour-drop-down-2', 'value'),
-    # Start data parameter
-    Input('date-selector', "start_date"),
-    # End date parameter
-    Input('date-selector', "end_date")
+    # Date range parameter
+    Input("memory-view", "data")
     )
-    def update_spec(product, title, limits, spec, colour, start_date, end_date):
-        # Extract df from product and retrieve columns
-        df = pd.read_json(product, orient='split')
+    # Built once per data version and inputs for every viewer, and patched when only new batches arrived
+    @cache_figure("spec-trend-graph", patch=True)
+    def update_spec(product, title, limits, spec, colour, view):
+        # Imported on first use so the server doesn't wait on plotly.express to start
+        import plotly.express as px
 
-        # Initiate dates
-        if end_date == None:
-            end_date = str(datetime.today()).split(" ")[0]
-        if start_date == None:
-            start_date = df.iloc[:, 0][1].split("T")[0]
+        # Batches of the selected dates and colour
+        df = load_view(product, view, colour)
 
-        df = df[start_date:end_date].loc[df[start_date:end_date][spec] > 1]
-        df.iloc[:, 0] = [date.split("T")[0] for date in df.iloc[:, 0]]
+        df = df.loc[df[spec] > 1]
+        df = df.assign(**{df.columns[0]: df.iloc[:, 0].dt.strftime("%Y-%m-%d")})
 
-        if colour != "All":
-            df = df.loc[df['Material Colour'] == colour]
+        # Batch positions are the x axis. Above TREND_MAX_POINTS only the points shaping the line and those out of limits are drawn
+        positions = np.arange(len(df))
+        render_mode = "auto"
+        if len(df) > TREND_MAX_POINTS:
+            positions = downsample_trend(positions, df[spec].to_numpy(), TREND_MAX_POINTS, limits.get(spec))
+            df = df.iloc[positions]
+            render_mode = "webgl"
             
         fig = px.line(
             df, 
-            x=range(len(df)),
+            x=positions,
             y=spec,
             markers=True,
-            custom_data=[df.columns[0]]
+            custom_data=[df.columns[0]],
+            render_mode=render_mode
         )
 
         fig.update_traces(
@@ -119,4 +120,4 @@ def spec_trend_graph_callback(app, colours):
 
         # Return plotly figure
         spec = spec.split(" ")[0]
-        return fig, f"{title} {spec} Trend"
\ No newline at end of file
+        return fig, f"{title} {spec} Trend"
\ No newline at end of file
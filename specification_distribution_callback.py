@@ -1,33 +1,36 @@
 # Data handling
 import numpy as np
-import pandas as pd
-from datetime import datetime
-from itertools import cycle
 
 # Data visualisation
 import plotly.graph_objects as go
 
 # Dashboard modules
 from dash import Input, Output
+from dash.exceptions import PreventUpdate
+
+# Imports from other files
+from data_store import load_histograms, view_dates
+from aggregates import histogram_counts
+from figure_cache import cache_figure
 
 def specification_distribution_callback(app, colours):
     # Callback function gets called wheever the selected product from the specification drop down menu changes. Updates the figure to the corresponding specification
     @app.callback(
         Output("spec-drop-down-dist", "options"),
         Output("colour-drop-down-1", "options"),
-        Input("memory", "data"),
+        Input("memory-schema", "data"),
     )
-    def update_graph_title(json):
-        # Extract df from product and retrieve columns
-        df = pd.read_json(json, orient='split')
-        
-        specs = [column for column in df.columns if df.dtypes[column]
-            == "int64" or df.dtypes[column] == "float64"]
+    def update_graph_title(schema):
+        # No product published yet, on a first start before the products directory has been listed
+        if schema is None:
+            raise PreventUpdate
+        # Numeric specification columns and colours of the product
+        specs = list(schema["specs"])
         
-        colours_options = [colour for colour in df["Material Colour"].unique()]
+        colours_options = list(schema["colours"])
         colours_options.append("All")
         
-        return specs, colours
+        return specs, colours_options
     
     # Callback function gets triggered whenever the date and/or specification value is changed
     @app.callback(
@@ -41,37 +44,29 @@ def specification_distribution_callback(app, colours):
         Input('spec-drop-down-dist', 'value'),
         # Colour drop down
         Input('colour-drop-down-1',"value"),
-        # Start data parameter
-        Input('date-selector', "start_date"),
-        # End date parameter
-        Input('date-selector', "end_date")
+        # Date range parameter
+        Input("memory-view", "data")
     )
-    def update_spec(product, title, spec, colour, start_date, end_date):
-        # Extract df from product and retrieve columns
-        df = pd.read_json(product, orient='split')
-        
-        columns = [column for column in df.columns if df.dtypes[column]
-            == "int64" or df.dtypes[column] == "float64"]
-        
-        colour_options = [colour for colour in df["Material Colour"].unique()]
-        colour_options.append("All")
+    # Built once per data version and inputs for every viewer, and patched when only new batches arrived
+    @cache_figure("spec-distribution", patch=True)
+    def update_spec(product, title, spec, colour, view):
+        # Specification histograms of the product, binned once per data version
+        histograms = load_histograms(product)
 
-        # Initiate dates
-        if end_date == None:
-            end_date = str(datetime.today()).split(" ")[0]
+        # Dates of the selected view
+        start_date, end_date = view_dates(view)
 
-        if start_date == None:
-            start_date = df.iloc[:, 0][1].split("T")[0]
-
-        df = df[start_date:end_date]
-        
-        if colour != "All":
-            df = df.loc[df['Material Colour'] == colour]
-        
-        spec_data = [x for x in df[spec][~np.isnan(df[spec])] if x > 1]
+        # Bin counts of the selected colour and dates, sent as bars so the payload doesn't grow with the history selected
+        edges, counts = histogram_counts(histograms, spec, colour, start_date, end_date)
 
         fig = go.Figure(
-            data=[go.Histogram(x=spec_data, marker=dict(color=colours["marker"]))])
+            data=[go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=counts,
+                width=np.diff(edges),
+                customdata=np.column_stack([edges[:-1], edges[1:]]) if len(counts) else None,
+                hovertemplate="%{customdata[0]:.4g} - %{customdata[1]:.4g}<br>Number of Batches: %{y}<extra></extra>",
+                marker=dict(color=colours["marker"]))])
 
         # fig.update_xaxes(showgrid=False)
         fig.update_yaxes(gridcolor=colours["border"])
@@ -95,7 +90,8 @@ def specification_distribution_callback(app, colours):
             plot_bgcolor=colours["content"],
             paper_bgcolor=colours["content"],
             font_color=colours["accent"],
-            font_family="Abel"
+            font_family="Abel",
+            bargap=0
         )
         # Return plotly figure
         
@@ -0,0 +1,121 @@
+# File sharing and data handling modules
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import date
+
+# Excel writer
+from openpyxl import Workbook
+
+# Sizes of the generated check sheets, in batches
+SIZES = (1000, 10000, 100000)
+# Batches made on a working day, spread over the three shifts from 06:00 to 22:00
+BATCHES_PER_DAY = 24
+# Title rows above the column labels, skipped by data_pipeline.read_workbook
+TITLE_ROWS = 5
+
+# Column labels, units and conforming limits rows of a QC check sheet
+COLUMNS = ["Date of Manufacture", "Batch No", "Material Colour", "Spread /mm", "Density kg/m3", "Strength /MPa",
+           "Colour", "Failure code", "Provisional result"]
+UNITS = ["dd/mm/yyyy", None, None, "mm", "kg/m3", "MPa", None, None, None]
+LIMITS = ["Conforming Limits", None, None, "90-120", "2000-2200", "min 30", None, None, None]
+
+# Material Colours of the generated products and how often each is made
+MATERIAL_COLOURS = {"Grey": 0.6, "Red": 0.2, "Blue": 0.15, "Green": 0.05}
+# Failure codes recorded by hand, in the mixed case they are typed in
+FAILURE_CODES = ["low flow", "High flow", "low density", "HIGH DENSITY", "Low strength", "contamination", "off colour"]
+
+# Product name and filename of a generated check sheet, ex: SYNTH 10K => SYNTH 10K check sheet.xlsx
+def synthetic_filename(rows):
+    size = f"{rows // 1000}K" if rows % 1000 == 0 else str(rows)
+    return f"SYNTH {size} check sheet.xlsx"
+
+# Converts generated values to cell values, with missing values as empty cells
+def cell_values(values, missing):
+    return [None if gap else value for value, gap in zip(values.tolist(), missing)]
+
+"""
+Generates the batch rows of a QC check sheet, ending today
+Every working day has BATCHES_PER_DAY batches through the shifts. Batches with a recorded spread are checked against the
+spread and density limits, and the rest against the strength limit, as evaluate_conforming_limits does
+A spread of 1 marks a failed batch. Some batches have no Material Colour, a hand written Failure code or a
+Provisional result, so every branch of the pipeline is exercised
+Returns the rows as a list of cell values per column
+
+"""
+def synthetic_batches(rows, seed=0, end=None):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=end or date.today(), periods=-(-rows // BATCHES_PER_DAY))
+    batch = np.arange(rows)
+    minutes = 360 + (batch % BATCHES_PER_DAY) * (960 // BATCHES_PER_DAY) + rng.integers(0, 30, rows)
+    made = days[batch // BATCHES_PER_DAY] + pd.to_timedelta(minutes, unit="min")
+
+    colours = rng.choice(list(MATERIAL_COLOURS), size=rows, p=list(MATERIAL_COLOURS.values()))
+    no_spread = rng.random(rows) < 0.15
+    spread = np.where(rng.random(rows) < 0.03, 1, np.rint(rng.normal(105, 8, rows)))
+    density = np.rint(rng.normal(2100, 50, rows))
+    strength = np.round(rng.normal(36, 4, rows), 1)
+
+    codes = rng.choice(FAILURE_CODES, size=(rows, 2))
+    failure_codes = np.where(rng.random(rows) < 0.3, np.char.add(np.char.add(codes[:, 0], ","), codes[:, 1]), codes[:, 0])
+    provisional = np.where(rng.random(rows) < 0.2, "FAIL", "Pass")
+
+    return [
+        made.to_pydatetime().tolist(),
+        [f"B{number:06d}" for number in batch + 1],
+        cell_values(colours, rng.random(rows) < 0.01),
+        cell_values(spread, no_spread),
+        cell_values(density, rng.random(rows) < 0.05),
+        cell_values(strength, ~no_spread),
+        cell_values(np.full(rows, "off"), rng.random(rows) >= 0.03),
+        cell_values(failure_codes, rng.random(rows) >= 0.05),
+        cell_values(provisional, rng.random(rows) >= 0.1),
+    ]
+
+"""
+Writes a QC check sheet laid out as the completed check sheets are
+Title rows, then the column labels, units and conforming limits rows, then a row per batch
+The workbook is streamed with openpyxl's write only mode so large sheets don't have to fit in memory as cells
+
+"""
+def write_workbook(path, columns):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("QC Check Sheet")
+    sheet.append(["Wishaw QC Check Sheet (synthetic)"])
+    for title_row in range(TITLE_ROWS - 1):
+        sheet.append([])
+    sheet.append(COLUMNS)
+    sheet.append(UNITS)
+    sheet.append(LIMITS)
+    for row in zip(*columns):
+        sheet.append(row)
+    workbook.save(path)
+
+"""
+Generates a check sheet per size in the products directory at path, named after its size
+Existing check sheets are kept unless overwrite is set, as generating the largest ones takes a while
+Returns the filenames of the check sheets
+
+"""
+def generate_products(path, sizes=SIZES, seed=0, overwrite=False):
+    os.makedirs(path, exist_ok=True)
+    filenames = []
+    for rows in sizes:
+        filename = synthetic_filename(rows)
+        if overwrite or not os.path.exists(os.path.join(path, filename)):
+            print(f"\nGenerating {filename}")
+            write_workbook(os.path.join(path, filename), synthetic_batches(rows, seed))
+        filenames.append(filename)
+    return filenames
+
+
+# Generate check sheets
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates synthetic QC check sheets")
+    parser.add_argument("path", help="Products directory to write the check sheets to")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Number of batches of each check sheet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--overwrite", action="store_true", help="Regenerate check sheets that already exist")
+    args = parser.parse_args()
+    generate_products(args.path, args.sizes, args.seed, args.overwrite)
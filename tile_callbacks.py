@@ -1,335 +1,143 @@
-# File sharing
-from sys import displayhook
-
 # Data handling
-import numpy as np
-import pandas as pd
 from datetime import date
 from datetime import timedelta
-from datetime import datetime
 import math
-from itertools import cycle
-
-# Data visualisation
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 # Dashboard modules
 from dash import Input, Output, html
+from dash.exceptions import PreventUpdate
+
+# Imports from other files
+from data_store import load_range_index, view_dates
+from aggregates import period_totals, pass_rate
+
+# Text of a single RFT tile. Periods without batches show empty
+def rft_statistic(rft, empty):
+    if math.isnan(rft):
+        return empty
+    return str(round(rft, 1)) + "%"
+
+# Multi colour RFT tile holding a statistic for every colour made in a period
+def multi_rft_tile(elements, colours):
+    return html.Div(
+        className="MultiStatTile",
+        style={
+            "color" : colours["text"]
+        },
+        children=[
+            html.Div(
+                className="StyledDataCard",
+                style={
+                    "borderColor": colours["border"],
+                    "color" : colours["text"],
+                    "backgroundColor" : colours["content"]
+                },
+                children=[
+                    html.Div(
+                        className="HandleWrapper",
+                        children=[
+                            html.Div(
+                                id="MultiRft",
+                                className="DataCardContent",
+                                children=elements
+                            ),
+                            html.Div(
+                                className="Handle",
+                                style={
+                                    "backgroundColor":colours["text"]
+                                }
+                            )
+                        ]
+                    )
+                ]
+            )
+        ]
+    )
 
 def tile_callbacks(app, colours):
-    # Callback to update RFT when product selected changes
+    # Callback to update every RFT tile when the product or dates change
     @app.callback(
-        # Changes the children attribute from the rftStat component
+        # Changes the children attribute of the single statistic tiles
         Output("rftStat", "children"),
-        # The value attribute from the product-drop-down component is the arguement for the below function
-        Input('memory', 'data'),
-        # Start data parameter
-        Input('date-selector', "start_date"),
-        # End date parameter
-        Input('date-selector', "end_date")
-    )
-    # Function to extract the RFT from the product
-    def update_rft(product, start_date, end_date):
-        # Extract df from selected product data and retrieve rft
-        df = pd.read_json(product, orient='split')
-
-        # Initiate dates
-        if end_date == None:
-            end_date = str(datetime.today()).split(" ")[0]
-        if start_date == None:
-            start_date = df.iloc[:, 0][1].split("T")[0]
-
-        df = df[start_date:end_date]
-
-        try:
-            rft = str(round((df['Result'].value_counts(
-                normalize=True)['Pass']*100), 1)) + "%"
-        except KeyError:
-            if len(df) > 0:
-                rft = 0
-            else:
-                rft = np.nan
-
-        return rft
-
-    # Callback to update the RFT for this week
-    @app.callback(
-        # Changes the children attribute from the rftStat component
         Output("rftWeek", "children"),
-        # The value attribute from the product-drop-down component is the arguement for the below function
-        Input('memory', 'data')
-    )
-    # Function to extract the RFT from the product
-    def update_rft(product):
-        # Extract df from selected product data and retrieve rft
-        df = pd.read_json(product, orient='split')
-        df = df[str(date.today() - timedelta(days=date.today().weekday()))            :str(date.today())]
-
-        try:
-            rft = round((df['Result'].value_counts(
-                normalize=True)['Pass']*100), 1)
-        except KeyError:
-            if len(df) > 0:
-                rft = 0
-            else:
-                rft = np.nan
-
-        if math.isnan(rft):
-            return "No Data"
-        return str(rft) + "%"
-
-    # Call back to update RFT for this month
-    @app.callback(
-        # Changes the children attribute from the rftStat component
         Output("rftMonth", "children"),
-        # The value attribute from the product-drop-down component is the arguement for the below function
-        Input('memory', 'data')
-    )
-    # Function to extract the RFT from the product
-    def update_rft(product):
-        # Extract df from selected product data and retrieve rft
-        df = pd.read_json(product, orient='split')
-        df = df[str(date.today() - timedelta(days=date.today().day)):str(date.today())]
-
-        try:
-            rft = round((df['Result'].value_counts(
-                normalize=True)['Pass']*100), 1)
-        except KeyError:
-            if len(df) > 0:
-                rft = 0
-            else:
-                rft = np.nan
-
-        if math.isnan(rft):
-            return "No Data"
-        return str(rft) + "%"
-
-
-    @app.callback(
-        # Changes the children attribute from the rftStat component
+        # Changes the children attribute of the multi colour tiles
         Output("multi-rft", "children"),
-        # The value attribute from the product-drop-down component is the arguement for the below function
-        Input('memory', 'data'),
-            # Start data parameter
-        Input('date-selector', "start_date"),
-        # End date parameter
-        Input('date-selector', "end_date")
-    )
-    # Function to extract the RFT from the product
-    def update_rft(product, start_date, end_date):
-        # Extract df from selected product data and retrieve rft
-        df = pd.read_json(product, orient='split')
-        
-        # Initiate dates
-        if end_date == None:
-            end_date = str(datetime.today()).split(" ")[0]
-        if start_date == None:
-            start_date = df.iloc[:, 0][1].split("T")[0]
-
-        df = df[start_date:end_date]
-
-        elements = []
-
-        for colour in df["Material Colour"].unique():
-            rft = round(df.groupby("Material Colour")[
-                "Result"].value_counts(normalize=True)[colour]["Pass"], 3) * 100
-            element = html.Div(children=[html.Div(
-                className="Statistic",
-                children=f"{str(rft)}%"
-            ),
-                html.P(
-                className="TileTitle",
-                children=f"{colour} RFT"
-            )]
-            )
-
-            elements.append(element)
-
-        return html.Div(
-            className="MultiStatTile",
-            style={
-                "color" : colours["text"]
-            },
-            children=[
-                html.Div(
-                    className="StyledDataCard",
-                    style={
-                        "borderColor": colours["border"],
-                        "color" : colours["text"],
-                        "backgroundColor" : colours["content"]
-                    },
-                    children=[
-                        html.Div(
-                            className="HandleWrapper",
-                            children=[
-                                html.Div(
-                                    id="MultiRft",
-                                    className="DataCardContent",
-                                    children=elements
-                                ),
-                                html.Div(
-                                    className="Handle",
-                                    style={
-                                        "backgroundColor":colours["text"]
-                                    }
-                                )
-                            ]
-                        )
-                    ]
-                )
-            ]
-        )
-
-
-    @app.callback(
-        # Changes the children attribute from the rftStat component
         Output("multi-rft-week", "children"),
-        # The value attribute from the product-drop-down component is the arguement for the below function
-        Input('memory', 'data')
-    )
-    # Function to extract the RFT from the product
-    def update_rft(product):
-        # Extract df from selected product data and retrieve rft
-        df = pd.read_json(product, orient='split')
-        df = df[str(date.today() - timedelta(days=date.today().weekday()))            :str(date.today())]
-
-        elements = []
-
-        for colour in df["Material Colour"].unique():
-            try:
-                rft = round(df.groupby("Material Colour")[
-                    "Result"].value_counts(normalize=True)[colour]["Pass"], 3) * 100
-            except KeyError:
-                rft = 0
-
-            element = html.Div(children=[html.Div(
-                className="Statistic",
-                children=f"{str(rft)}%"
-            ),
-                html.P(
-                className="TileTitle",
-                children=f"This Week {colour} RFT"
-            )]
-            )
-
-            elements.append(element)
-
-        return html.Div(
-            className="MultiStatTile",
-            style={
-                "color" : colours["text"]
-            },
-            children=[
-                html.Div(
-                    className="StyledDataCard",
-                    style={
-                        "borderColor": colours["border"],
-                        "color" : colours["text"],
-                        "backgroundColor" : colours["content"]
-                    },
-                    children=[
-                        html.Div(
-                            className="HandleWrapper",
-                            children=[
-                                html.Div(
-                                    id="MultiRft",
-                                    className="DataCardContent",
-                                    children=elements
-                                ),
-                                html.Div(
-                                    className="Handle",
-                                    style={
-                                        "backgroundColor":colours["text"]
-                                    }
-                                )
-                            ]
-                        )
-                    ]
-                )
-            ]
-        )
-
-
-    @app.callback(
-        # Changes the children attribute from the rftStat component
         Output("multi-rft-month", "children"),
         # The value attribute from the product-drop-down component is the arguement for the below function
-        Input('memory', 'data')
+        Input('memory', 'data'),
+        # Date range parameter
+        Input("memory-view", "data")
     )
-    # Function to extract the RFT from the product
-    def update_rft(product):
-        # Extract df from selected product data and retrieve rft
-        df = pd.read_json(product, orient='split')
-        df = df[str(date.today() - timedelta(days=date.today().day))            :str(date.today())]
+    # Function to extract the overall, this week and this month RFT of the product and each of its colours
+    def update_tiles(product, view):
+        # No product published yet, on a first start before the products directory has been listed
+        if product is None or view is None:
+            raise PreventUpdate
+        # Cumulative count index of selected product data
+        range_index = load_range_index(product)
+
+        # Dates of the selected view
+        start_date, end_date = view_dates(view)
+
+        # Selected range, this week and this month
+        today = date.today()
+        periods = [
+            (start_date, end_date),
+            (str(today - timedelta(days=today.weekday())), str(today)),
+            (str(today - timedelta(days=today.day)), str(today))
+        ]
+        totals = period_totals(range_index, periods)
+        passes = range_index["All"].columns.index("passes")
+        batches = range_index["All"].columns.index("batches")
+
+        all_counts, all_firsts = totals.pop("All")
+        rfts = [pass_rate(all_counts[period, passes], all_counts[period, batches]) for period in range(len(periods))]
+
+        tiles = []
+        for period, title in enumerate(["{} RFT", "This Week {} RFT", "This Month {} RFT"]):
+            # Colours made in the period in order of their first batch
+            made = sorted((firsts[period], colour) for colour, (colour_counts, firsts) in totals.items() if firsts[period] >= 0)
+
+            elements = []
+            for first, colour in made:
+                counts = totals[colour][0][period]
+                if counts[passes] == 0:
+                    rft = 0
+                else:
+                    rft = round(counts[passes] / counts[batches], 3) * 100
+
+                element = html.Div(children=[html.Div(
+                    className="Statistic",
+                    children=f"{str(rft)}%"
+                ),
+                    html.P(
+                    className="TileTitle",
+                    children=title.format(colour)
+                )]
+                )
 
-        elements = []
+                elements.append(element)
 
-        for colour in df["Material Colour"].unique():
-            try:
-                rft = round(df.groupby("Material Colour")[
-                    "Result"].value_counts(normalize=True)[colour]["Pass"], 3) * 100
-            except:
-                rft = 0
+            tiles.append(multi_rft_tile(elements, colours))
 
-            element = html.Div(children=[html.Div(
-                className="Statistic",
-                children=f"{str(rft)}%"
-            ),
-                html.P(
-                className="TileTitle",
-                children=f"This Month {colour} RFT"
-            )]
-            )
+        # The overall tile shows a bare 0 when nothing passed
+        overall = rfts[0] if rfts[0] == 0 else rft_statistic(rfts[0], rfts[0])
 
-            elements.append(element)
-
-        return html.Div(
-            className="MultiStatTile",
-            style={
-                "color" : colours["text"]
-            },
-            children=[
-                html.Div(
-                    className="StyledDataCard",
-                    style={
-                        "borderColor": colours["border"],
-                        "color" : colours["text"],
-                        "backgroundColor" : colours["content"]
-                    },
-                    children=[
-                        html.Div(
-                            className="HandleWrapper",
-                            children=[
-                                html.Div(
-                                    id="MultiRft",
-                                    className="DataCardContent",
-                                    children=elements
-                                ),
-                                html.Div(
-                                    className="Handle",
-                                    style={
-                                        "backgroundColor":colours["text"]
-                                    }
-                                )
-                            ]
-                        )
-                    ]
-                )
-            ]
-        )
+        return (overall, rft_statistic(rfts[1], "No Data"), rft_statistic(rfts[2], "No Data"), *tiles)
 
     @app.callback(
         Output("multi-stat-div", "style"),
         Output("colour-drop-down-1", "style"),
         Output("colour-drop-down-2", "style"),
         Output("colour-drop-down-3", "style"),
-        Input("memory", "data")
+        Input("memory-schema", "data")
     )
-    def display_multi_rft(product):
-        df = pd.read_json(product, orient='split')
-
-        if len(df['Material Colour'].unique()) == 1:
+    def display_multi_rft(schema):
+        if schema is None:
+            raise PreventUpdate
+        if len(schema["colours"]) == 1:
             return {'display': 'none'}, {'display': 'none'}, {'display': 'none'}, {'display': 'none'}
         return {}, {}, {}, {}
 
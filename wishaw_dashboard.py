@@ -1,38 +1,33 @@
 # File sharing
 import os
-from sys import displayhook
 
 # Data handling
-import pandas as pd
 from datetime import date
 from datetime import datetime
 
 # Dashboard modules
-from dash import Dash, Input, Output, html, dcc
+from dash import Dash, Input, Output, State, html, dcc, no_update
+from dash.exceptions import PreventUpdate
 
 # Imports from other files
-from data_pipeline import process_product_data
+from product_index import product_index, start_discovery
+from data_store import publish_product, resolve_view
+from aggregates import GRANULARITIES
+from prefetch import start_prefetch
 from my_dash_components import graph_element, stat_tile_element
-from callbacks.rft_callback import rft_callback
-from callbacks.colour_rate_callback import colour_rate_callback
-from callbacks.tile_callbacks import tile_callbacks
-from callbacks.specification_distribution_callback import specification_distribution_callback
-from callbacks.failure_pie_chart_callback import failure_pie_chart_callback
-from callbacks.spec_trend_graph_callback import spec_trend_graph_callback
+from rft_callback import rft_callback
+from colour_rate_callback import colour_rate_callback
+from tile_callbacks import tile_callbacks
+from specification_distribution_callback import specification_distribution_callback
+from failure_pie_chart_callback import failure_pie_chart_callback
+from spec_trend_graph_callback import spec_trend_graph_callback
 
 # Disable warnings
 import warnings
 warnings.filterwarnings('ignore')
 
-# Declare list of products
-qc_excels = os.listdir(
-    "G:\Quality Control\Quality Management System\QC Docs\QC\QC Check Sheets\QC Completed Check Sheets\Products")
-products = [" ".join(product.split(" ")[:2]) for product in qc_excels]
-
-# Dict for indicate product to file. Key : Product => Value : Filename
-product_file_dict = {}
-for file_index, product in enumerate(products):
-    product_file_dict[product] = qc_excels[file_index]
+# Declare list of products, as last listed. The products directory is listed in the background so start up doesn't wait on the share
+products = product_index.products()
 
 # Colours
 colours = {
@@ -54,7 +49,7 @@ sika_logo = html.Img(
 # Dropdown to select product QC data
 product_dropdown = dcc.Dropdown(
     options=products,
-    value=products[0],
+    value=products[0] if products else None,
     id="product-drop-down",
 )
 
@@ -66,6 +61,14 @@ date_selector = dcc.DatePickerRange(
     calendar_orientation='vertical',
 )
 
+# Drop down to select the time buckets of the trend graphs
+granularity_selector = dcc.Dropdown(
+    options=[{"label": label, "value": granularity} for granularity, label in GRANULARITIES.items()],
+    value="week",
+    clearable=False,
+    id="granularity-selector",
+)
+
 snapshot_date = html.P(
     id="snapshot-date"
 )
@@ -123,16 +126,25 @@ app.layout = html.Div(
         "color": colours["text"]
     },
     children=[
-        # DCC memory store element to store corresponding product dataframes, product title and the conforming limits for the selected product
+        # DCC memory store element to store the server side store key of the product dataframe, product title, the conforming limits and the schema record for the selected product
         dcc.Store(id='memory'),
         dcc.Store(id='memory-title'),
         dcc.Store(id="memory-limits"),
+        dcc.Store(id="memory-schema"),
+        # DCC memory store element to store the date range every chart shows
+        dcc.Store(id="memory-view"),
         # DCC interval component to refresh data every 30 seconds
         dcc.Interval(
             id="interval-component",
             interval=30000,
             n_intervals=0
         ),
+        # DCC interval component to fill in the product options every second until the products directory has been listed
+        dcc.Interval(
+            id="product-index-interval",
+            interval=1000,
+            n_intervals=0
+        ),
         # Header
         html.H1(
             id="header",
@@ -144,6 +156,7 @@ app.layout = html.Div(
                 "Wishaw QC Dashboard",
                 product_dropdown,
                 date_selector,
+                granularity_selector,
                 snapshot_date
             ],
         ),
@@ -214,37 +227,103 @@ app.layout = html.Div(
         )
     ])
 
+# Callback function that fills in the product options once the products directory has been listed, and keeps them up to date
+@app.callback(
+    Output("product-drop-down", "options"),
+    Output("product-drop-down", "value"),
+    # Stops the fast interval once the products are listed
+    Output("product-index-interval", "disabled"),
+    Input("product-index-interval", "n_intervals"),
+    Input("interval-component", "n_intervals"),
+    State("product-drop-down", "options"),
+    State("product-drop-down", "value")
+)
+def product_options(index_intervals, n_intervals, current_options, current_product):
+    options = product_index.products()
+    listed = product_index.listed.is_set()
+    # Keep the selected product while it is still available, or until the products are known
+    product = current_product if current_product in options or not options else options[0]
+
+    return (options if options != current_options else no_update,
+            product if product != current_product else no_update,
+            listed)
+
 # Callback function that is triggered when the selected product from the drop down component is changed. Updates the data of all dcc.Store components
 @app.callback(
-    # dcc.Store to keep df of product in memory
+    # dcc.Store to keep the key of the product df in the server side store
     Output("memory", "data"),
     # dcc.Store to keep name of product in memory
     Output("memory-title", "data"),
     # dcc.Store to keep conforming limits of product in memory
     Output("memory-limits", "data"),
+    # dcc.Store to keep the spec columns, colours and date span of product in memory
+    Output("memory-schema", "data"),
     # Changes the snapshot date of data
     Output("snapshot-date", "children"),
     Input("product-drop-down", "value"),
     # Call functions whenever the number of intervals is incremented
-    Input("interval-component", "n_intervals")
+    Input("interval-component", "n_intervals"),
+    # Key currently held in memory, carrying the data version it was published with
+    State("memory", "data")
 )
 # Function to retrieve and return data from selected product and
-def memory_output(product, n_intervals):
-    # Extract df from product file
-    df, limits = process_product_data(product_file_dict[product])
+def memory_output(product, n_intervals, current_key):
+    # No product until the products directory has been listed for the first time
+    if product is None:
+        raise PreventUpdate
+    # Product removed from the share. Its graphs are kept until product_options moves the drop down to a listed product
+    filename = product_index.filename(product)
+    if filename is None:
+        raise PreventUpdate
+    # Extract df from product file and publish it to the server side store. Only re-processed when the workbook has changed since the last tick
+    key, limits, schema = publish_product(product, filename)
+    # This week, this month and open ended date ranges move on with the day, so a new day counts as a change
+    key["day"] = str(date.today())
+    snapshot = f"QC Snapshot Date : {datetime.today()}"
+
+    if current_key is not None and key["file"] == current_key["file"]:
+        # Same product, data version and day as the last refresh. Leave the stores untouched so graphs and tiles aren't re-run
+        if key["version"] == current_key["version"] and key["day"] == current_key.get("day"):
+            return no_update, no_update, no_update, no_update, snapshot
+        # New data for the product on display. Graphs patch the figures built from the version the browser holds
+        if key["version"] != current_key["version"]:
+            key["previous"] = current_key["version"]
     # Return
-    return df.to_json(date_format='iso', orient='split'), product, limits, f"QC Snapshot Date : {datetime.today()}"
+    return key, product, limits, schema, snapshot
+
+# Callback function that resolves the selected dates once for every chart. Triggered when the dates or the product change
+@app.callback(
+    # dcc.Store to keep the resolved date range in memory
+    Output("memory-view", "data"),
+    Input("memory-schema", "data"),
+    # Start data parameter
+    Input('date-selector', "start_date"),
+    # End date parameter
+    Input('date-selector', "end_date"),
+    # View currently held in memory
+    State("memory-view", "data")
+)
+def view_output(schema, start_date, end_date, current_view):
+    # No product published yet, on a first start before the products directory has been listed
+    if schema is None:
+        raise PreventUpdate
+    view = resolve_view(schema, start_date, end_date)
+    # Unchanged view, for example a new data version of the same product. Charts are only triggered by the new data
+    if view == current_view:
+        return no_update
+    return view
 
 # Display start date and end date if no dates were initially selected
 @app.callback(
     # Update start and end date attributes
     Output("date-selector", "start_date_placeholder_text"),
-    Input("memory", "data")
+    Input("memory-schema", "data")
 )
-def display_start_date(json):
-    df = pd.read_json(json, orient='split')
+def display_start_date(schema):
+    if schema is None:
+        raise PreventUpdate
     # Return
-    return df.iloc[:, 0][1].split("T")[0]
+    return schema["default_start"]
 
 # Graph callbacks
 rft_callback(app, colours)
@@ -258,5 +337,11 @@ tile_callbacks(app, colours)
 
 # Run server
 if __name__ == '__main__':
+    debug = True
+    # List and warm every product in the background. With the debug reloader only the serving child process does
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_discovery()
+        start_prefetch(product_index.files)
     print("\nRunning dashboard server...")
-    app.run_server(debug=True)
+    # The pipeline never changes the working directory, so callbacks can be served on many threads
+    app.run_server(debug=debug, threaded=True)
@@ -0,0 +1,30 @@
+# File sharing
+import os
+
+# Imports from other files
+from wishaw_dashboard import app
+from product_index import product_index, start_discovery
+from prefetch import start_prefetch
+from sidecar_cache import CACHE_PATH
+from shared_cache import claim_lock
+
+# Lock file of the one worker that prefetches products
+PREFETCH_LOCK = os.path.join(CACHE_PATH, "prefetch.lock")
+
+"""
+Production entry point serving the dashboard from several worker processes behind one port, for example
+    gunicorn --workers 4 --threads 4 --bind 0.0.0.0:8050 wsgi:server
+or on Windows, where gunicorn isn't available
+    waitress-serve --listen=*:8050 --threads 8 wsgi:server
+Workers share parsed products through the parquet sidecars and the derived aggregates written to the cache directory,
+and take a lock file before reading a workbook, so each workbook is parsed once per plant rather than once per worker
+Products are listed in the background and warmed by the first worker to claim PREFETCH_LOCK. When it stops, the next
+worker to start takes over. Set QC_PREFETCH=0 to leave warming them to the first request for each of them
+
+"""
+server = app.server
+
+start_discovery()
+# Only one worker prefetches, so its pool is the only one parsing. The others read what it parsed from the sidecars
+if os.environ.get("QC_PREFETCH", "1") != "0" and claim_lock(PREFETCH_LOCK):
+    start_prefetch(product_index.files, PREFETCH_LOCK)